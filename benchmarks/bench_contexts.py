@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""bench_contexts -- renders/sec of a template-heavy situation.
+
+Compares the context types, whose builtin methods are wrapped once per
+class, against the original `__getattribute__` hook, which inspected every
+attribute access and wrapped builtin methods anew each time.
+
+Usage: python benchmarks/bench_contexts.py [RENDERS]
+"""
+import sys
+import time
+import inspect
+
+from storyline import contexts
+from storyline import templates
+
+SITUATION = u"""
+% for i in range(20)
+{{ this.set('visits', this.get('visits', 0) + 1) }}{{ flags.add('seen %d' % (i % 5)) }}
+% if I.am('wearing cloak') and 'seen 1' in flags
+You have been here {{ my.get('visits') }} times.
+% endif
+% for key, value in this.items()
+{{ key }}: {{ value }}{{ commands.append(('noop', key)) }}
+% endfor
+{{ this.incr('counter') }}{{ flags.discard('seen 0') }}
+% endfor
+"""
+
+
+class LegacyContextMixin(object):
+    """The original ContextMixin.
+    """
+    def __getattribute__(self, name):
+        value = object.__getattribute__(self, name)
+        if inspect.isbuiltin(value) and hasattr(value, '__call__'):
+            meth = value
+
+            def wrapper(*args, **kwargs):
+                result = meth(*args, **kwargs)
+                if result is None:
+                    return u''
+                else:
+                    return result
+            return wrapper
+        else:
+            return value
+
+
+class LegacyContextState(LegacyContextMixin, dict):
+    set = contexts.ContextState.set.im_func
+    is_ = are = am = contexts.ContextState.is_.im_func
+    incr = contexts.ContextState.incr.im_func
+
+
+class LegacyContextSet(LegacyContextMixin, set):
+    pass
+
+
+class LegacyContextList(LegacyContextMixin, list):
+    pass
+
+
+def bench(label, state_class, set_class, list_class, renders, repeat=3):
+    template = templates.registry.get(SITUATION)
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for _ in xrange(renders):
+            this = state_class({'wearing cloak': True})
+            template.render(
+                this=this, I=this, my=this,
+                flags=set_class(), commands=list_class(),
+            )
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print "{:<28} {:>8,.0f} renders/sec ({:.1f}us each)".format(
+        label, renders / best, best / renders * 1e6)
+
+
+def main():
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bench('__getattribute__ (before)', LegacyContextState, LegacyContextSet, LegacyContextList, renders)
+    bench('wrapped per class (after)', contexts.ContextState, contexts.ContextSet, contexts.ContextList, renders)
+
+
+if __name__ == '__main__':
+    main()
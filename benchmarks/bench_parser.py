@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""bench_parser -- lines/sec for StoryParser on a multi-megabyte corpus.
+
+Compares the prefix-regex classifier against the original scan of
+`event_map`, then times a full parse into a ParserState.
+
+Usage: python benchmarks/bench_parser.py [MEGABYTES]
+"""
+import sys
+import time
+
+from path import path
+
+from storyline import parser
+
+CLOAK = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+
+
+class NullState(object):
+    def add_series(self, name): pass
+    def add_situation(self, name): pass
+    def add_directive(self, name): pass
+    def add_line(self, line): pass
+
+
+class ScanningStoryParser(parser.StoryParser):
+    """The original classifier: scan event_map and getattr for every line.
+    """
+    def parse(self, state, name, storydef):
+        state.add_series(name)
+        for line in storydef.splitlines():
+            self.parse_line(state, line)
+
+    def parse_line(self, state, line):
+        for key in self.event_map:
+            if line.startswith(key):
+                handler = getattr(self, 'on_' + self.event_map[key])
+                handler(state, line)
+                break
+        else:
+            self.on_line(state, line)
+
+
+def make_corpus(megabytes):
+    sample = u'\n'.join(fp.text() for fp in sorted(CLOAK.files('*.md')))
+    return sample * int(megabytes * 1024 * 1024 / len(sample) + 1)
+
+
+def bench(label, story_parser, state_factory, corpus, repeat=3):
+    lines = len(corpus.splitlines())
+    best = None
+    for _ in range(repeat):
+        state = state_factory()
+        start = time.time()
+        story_parser.parse(state, u'corpus', corpus)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print "{:<32} {:>10,.0f} lines/sec ({:.3f}s)".format(label, lines / best, best)
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    corpus = make_corpus(megabytes)
+    print "Corpus: {:,} bytes, {:,} lines".format(len(corpus), len(corpus.splitlines()))
+
+    bench('classify, event_map scan', ScanningStoryParser(), NullState, corpus)
+    bench('classify, prefix regex', parser.StoryParser(), NullState, corpus)
+    bench('parse, event_map scan', ScanningStoryParser(), parser.ParserState, corpus)
+    bench('parse, prefix regex', parser.StoryParser(), parser.ParserState, corpus)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""bench_transitions -- cost of PlotState transitions on the cloak story.
+
+Times push/pop/replace round trips three ways: one validated state per
+step (`copy`, as before), one trusted state per step (`_evolve`), and one
+state per round, applying the steps to a single `Transition`.
+
+Usage: python benchmarks/bench_transitions.py [ROUNDS]
+"""
+import sys
+import time
+import warnings
+
+from path import path
+
+from storyline import states
+from storyline import storyfile
+
+CLOAK = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+
+
+def validating_evolve(self, **changes):
+    """The original transitions: every intermediate state is validated.
+    """
+    return self.copy(**changes)
+
+
+COMMANDS = [
+    ('push', u'rooms::cloakroom'),
+    ('pop', ),
+    ('replace', u'rooms::bar'),
+    ('replace', u'rooms::foyer'),
+]
+
+
+def run_steps(state, rounds):
+    for _ in range(rounds):
+        for command in COMMANDS:
+            state = state.run_command(command)
+        state = state.clear_messages()
+    return state
+
+
+def run_transitions(state, rounds):
+    for _ in range(rounds):
+        transition = state.transition()
+        for command in COMMANDS:
+            transition.run_command(command)
+        state = transition.freeze().clear_messages()
+    return state
+
+
+def bench(label, run, evolve, plot, rounds, repeat=3):
+    trusted_evolve = states.PlotState._evolve
+    states.PlotState._evolve = evolve
+    try:
+        state = states.PlotState(plot).push(plot.get_start_situation()).clear_messages()
+        transitions = rounds * len(COMMANDS)
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            run(state, rounds)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        states.PlotState._evolve = trusted_evolve
+    print "{:<32} {:>8,.0f} transitions/sec ({:.1f}us each)".format(
+        label, transitions / best, best / transitions * 1e6)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    warnings.simplefilter('ignore')  # Most situations have no on_enter/on_exit.
+    plot = storyfile.load_plot_from_path(CLOAK)
+    plot.warm()
+    bench('validated state per step', run_steps, validating_evolve, plot, rounds)
+    bench('trusted state per step', run_steps, states.PlotState._evolve, plot, rounds)
+    bench('one Transition per round', run_transitions, states.PlotState._evolve, plot, rounds)
+
+
+if __name__ == '__main__':
+    main()
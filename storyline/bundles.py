@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""storyline.bundles -- ahead-of-time compiled plot bundles.
+
+A bundle is a single binary file holding a fully built Plot: its config,
+series, situations and directives, along with the compiled code of every
+distinct Jinja template, which is loaded into the template registry, and
+the HTML of every static message (see `entities.Plot.static_html`).
+Loading a bundle skips parsing, content compilation, entity validation,
+template compilation and static message conversion altogether.
+
+The bundle starts with the modification time of each source file it was
+compiled from, so its freshness can be checked without loading the rest.
+
+Template code is stored marshalled, so a bundle can only be loaded by the
+same Python version that wrote it.
+"""
+import imp
+import marshal
+import cPickle as pickle
+import logging
+logger = logging.getLogger('storyline.bundles')
+
+from nonobvious import frozendict, frozenlist
+
+from . import defaults
+from . import entities
+from . import templates
+
+BUNDLE_NAME = 'plot.bundle'
+
+MAGIC = 'storyline-bundle:3:' + imp.get_magic()
+
+
+class BundleError(ValueError):
+    """The bundle is unreadable, or was written by another Python version.
+    """
+    pass
+
+
+def _build(entity_class, data):
+    """Construct an entity from already-validated data, skipping validation.
+    """
+    entity = entity_class.__new__(entity_class)
+    dict.update(entity, data)
+    return entity
+
+
+def _dump_renderable(entity, codes, *nested):
+    data = dict((k, v) for k, v in entity.iteritems() if k not in nested)
+    if codes is not None and 'content' in entity:
+        key = templates.get_source_key(entity.content)
+        if key not in codes:
+            codes[key] = marshal.dumps(templates.compile_template_code(entity.content))
+    return data
+
+
+def _load_renderable(entity_class, data, **nested):
+    data.update(nested)
+    return _build(entity_class, data)
+
+
+def dump_series(series, codes=None):
+    """Return a picklable representation of the Series.
+
+    The compiled code of its templates is added to the `codes` dict, if
+    given, by source key, for `load_templates`.
+    """
+    return (
+        _dump_renderable(series, codes, 'ordered', 'by_name'),
+        [
+            (
+                _dump_renderable(situation, codes, 'directives'),
+                [
+                    (name, _dump_renderable(directive, codes))
+                    for name, directive in situation.directives.iteritems()
+                ],
+            )
+            for situation in series.ordered
+        ],
+    )
+
+
+def load_series(dumped):
+    """Rebuild a Series from the output of `dump_series`.
+    """
+    series_data, situations_data = dumped
+    situations = frozenlist(
+        _load_renderable(
+            entities.Situation, situation_data,
+            directives = frozendict(
+                (name, _load_renderable(entities.Directive, directive_data))
+                for name, directive_data in directives_data
+            ),
+        )
+        for situation_data, directives_data in situations_data
+    )
+    return _load_renderable(
+        entities.Series, series_data,
+        ordered = situations,
+        by_name = frozendict((s.name, s) for s in situations),
+    )
+
+
+def load_templates(codes):
+    """Add the compiled templates from `dump_series` to the template registry.
+    """
+    registry = templates.registry
+    for key, code in codes.iteritems():
+        if key not in registry:
+            registry.add(key, templates.get_template_from_code(marshal.loads(code)))
+
+
+def dump_plot(plot, fo, sources):
+    """Write the Plot as a bundle to the open binary file.
+
+    `sources` maps the path of each source file the plot was compiled
+    from, relative to the story path, to its modification time, as taken
+    by `storyfile.get_source_stamps` before compiling. A bundle is only
+    fresh while they match.
+    """
+    codes = {}
+    series = [dump_series(s, codes) for s in plot.by_name.itervalues()]
+    fo.write(MAGIC)
+    pickle.dump(sources, fo, pickle.HIGHEST_PROTOCOL)
+    pickle.dump(
+        {
+            'config': plot.config.dict(),
+            'series': series,
+            'templates': codes,
+            'static_html': plot.pin_static_html(),
+        },
+        fo,
+        pickle.HIGHEST_PROTOCOL,
+    )
+
+
+def load_sources(fi):
+    """Read the source files' modification times from a bundle in the open binary file.
+    """
+    if fi.read(len(MAGIC)) != MAGIC:
+        raise BundleError("Not a bundle, or written by a different Python version.")
+    try:
+        return pickle.load(fi)
+    except Exception as e:
+        raise BundleError("Unreadable bundle: {}".format(e))
+
+
+def load_plot(fi):
+    """Read a Plot from a bundle in the open binary file.
+    """
+    load_sources(fi)
+    try:
+        data = pickle.load(fi)
+    except Exception as e:
+        raise BundleError("Unreadable bundle: {}".format(e))
+
+    load_templates(data['templates'])
+    series = [load_series(s) for s in data['series']]
+    plot = _build(entities.Plot, {
+        'by_name': frozendict((s.name, s) for s in series),
+        'config': defaults.load_config(data['config']),
+    })
+    plot.resolve_addresses()
+    plot.static_html.update(data.get('static_html', {}))
+    return plot
+
+
+def write_bundle(plot, bundle_path, sources):
+    """Write the Plot to the bundle file at the given path.
+
+    See `dump_plot` for `sources`.
+    """
+    logger.info("Writing bundle {}".format(bundle_path))
+    with open(bundle_path, 'wb') as fo:
+        dump_plot(plot, fo, sources)
+
+
+def read_bundle(bundle_path):
+    """Read the Plot from the bundle file at the given path.
+    """
+    logger.info("Loading bundle {}".format(bundle_path))
+    with open(bundle_path, 'rb') as fi:
+        return load_plot(fi)
+
+
+def read_bundle_sources(bundle_path):
+    """Read the source files' modification times from the bundle file at the given path.
+    """
+    with open(bundle_path, 'rb') as fi:
+        return load_sources(fi)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""storyline.caches -- bounded in-process caches.
+"""
+import threading
+import collections
+
+
+class LRUCache(object):
+    """A thread-safe, bounded cache that evicts the least recently used entries.
+
+    Keeps count of its hits, misses and evictions.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Return the cached value for the key, or the default.
+        """
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache the value for the key, evicting the oldest entries if need be.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return the cache's size and counters.
+        """
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -1,7 +1,63 @@
 # -*- coding: utf-8 -*-
 """storyline.context
 """
-import inspect
+import abc
+import types
+import collections
+
+
+method_descriptor = type(dict.get)
+
+#: Where the collections ABCs, and so their mixin methods, are defined.
+abc_module = collections.MutableMapping.__module__
+
+
+def empty_for_none(method):
+    """Wrap the method to return the empty string instead of None.
+    """
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if result is None:
+            return u''
+        else:
+            return result
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def is_abc_mixin(cls, attr):
+    """Is the attribute a mixin method inherited from one of the collections ABCs?
+    """
+    for base in cls.__mro__:
+        if attr in base.__dict__:
+            return (base.__module__ == abc_module
+                    and isinstance(base.__dict__[attr], types.FunctionType))
+    return False
+
+
+class ContextMeta(type):
+    """Wraps the public builtin methods of context classes with `empty_for_none`.
+
+    Mixin methods from the collections ABCs (e.g. `MutableMapping.update`)
+    are wrapped too. This happens once, when the class is created, so
+    attribute access on instances is as fast as on any other object.
+    """
+    def __new__(mcs, name, bases, attrs):
+        cls = super(ContextMeta, mcs).__new__(mcs, name, bases, attrs)
+        for attr in dir(cls):
+            if not attr.startswith('_'):
+                value = getattr(cls, attr)
+                if isinstance(value, method_descriptor):
+                    setattr(cls, attr, empty_for_none(value))
+                elif is_abc_mixin(cls, attr):
+                    setattr(cls, attr, empty_for_none(value.im_func))
+        return cls
+
+
+class ContextABCMeta(ContextMeta, abc.ABCMeta):
+    """ContextMeta, for context classes based on the collections ABCs.
+    """
 
 
 class ContextMixin(object):
@@ -9,22 +65,7 @@ class ContextMixin(object):
 
     Wraps methods on the object to return the empty string instead of None.
     """
-    def __getattribute__(self, name):
-        """Coerce methods that return None to return the empty string.
-        """
-        value = object.__getattribute__(self, name)
-        if inspect.isbuiltin(value) and hasattr(value, '__call__'):
-            meth = value
-
-            def wrapper(*args, **kwargs):
-                result = meth(*args, **kwargs)
-                if result is None:
-                    return u''
-                else:
-                    return result
-            return wrapper
-        else:
-            return value
+    __metaclass__ = ContextMeta
 
 
 class ContextState(ContextMixin, dict):
@@ -82,3 +123,104 @@ class ContextList(ContextMixin, list):
     """A context-ready list.
     """
     pass
+
+
+class ContextLocations(ContextMixin, collections.MutableMapping):
+    """A copy-on-write, context-ready view of a state's locations.
+
+    Each location is copied into a ContextState the first time it is looked
+    up; the others are never copied. See `changes`.
+    """
+    __metaclass__ = ContextABCMeta
+    def __init__(self, locations):
+        self.locations = locations
+        self.copies = {}
+        self.deleted = set()
+
+    def __getitem__(self, name):
+        try:
+            return self.copies[name]
+        except KeyError:
+            if name in self.deleted:
+                raise
+            location = self.copies[name] = ContextState(self.locations[name])
+            return location
+
+    def __setitem__(self, name, value):
+        self.deleted.discard(name)
+        self.copies[name] = value if isinstance(value, ContextState) else ContextState(value)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.copies.pop(name, None)
+        self.deleted.add(name)
+
+    def __contains__(self, name):
+        return name not in self.deleted and (name in self.copies or name in self.locations)
+
+    def __iter__(self):
+        for name in self.locations:
+            if name not in self.deleted:
+                yield name
+        for name in self.copies:
+            if name not in self.locations:
+                yield name
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+    def set(self, name, value):
+        self[name] = value
+        return u''
+
+    def location(self, name):
+        """Return the named location, starting it empty if there is none yet.
+        """
+        try:
+            return self[name]
+        except KeyError:
+            location = self[name] = ContextState()
+            return location
+
+    def changes(self):
+        """Return the locations that differ from the originals, and those deleted.
+
+        Locations that were only looked up, or started and left empty, are
+        not changes.
+        """
+        changed = dict(
+            (name, location)
+            for name, location in self.copies.iteritems()
+            if location != self.locations.get(name, {})
+        )
+        deleted = set(name for name in self.deleted if name in self.locations)
+        return changed, deleted
+
+
+class LazyContext(collections.Mapping):
+    """A template context whose values are only built when first looked up.
+
+    `builders` maps each name in the context to a function which, given the
+    context, builds its value. Values built so far are kept in `built`.
+    """
+    builders = {}
+
+    def __init__(self):
+        self.built = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.built[name]
+        except KeyError:
+            value = self.built[name] = self.builders[name](self)
+            return value
+
+    def __contains__(self, name):
+        return name in self.builders
+
+    def __iter__(self):
+        return iter(self.builders)
+
+    def __len__(self):
+        return len(self.builders)
@@ -10,6 +10,24 @@ start = string(default="start")
 
 [markdown]
 extensions = string_list(default=list())
+
+[templates]
+bytecode_cache = string(default="")
+# Distinct template sources kept compiled, shared between reloads.
+registry_size = integer(min=1, default=4096)
+
+[state]
+# The compact serializer numbers situations and flags by plot version: a
+# state saved before an edit that adds or removes any, if the server has
+# restarted since, can't be read, and the player starts over.
+serializer = option("msgpack", "compact", "delta", default="msgpack")
+store = option("cookie", "sqlite", default="cookie")
+sqlite_path = string(default="states.sqlite")
+batch_size = integer(min=1, default=1)
+# Seconds after which a SQLite-stored state expires (0 for never); 31 days,
+# as for session cookies.
+max_age = integer(min=0, default=2678400)
+cache_size = integer(min=0, default=1024)
 """.splitlines(), list_values=False)
 
 
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 """storyline.entities
 """
+import json
+import hashlib
+import operator
 import warnings
+from multiprocessing.pool import ThreadPool
 
 from nonobvious import entities
 from nonobvious import fields
@@ -11,6 +15,8 @@ from configobj import ConfigObj
 
 from . import templates
 from . import defaults
+from . import symbols
+from . import presenters
 
 
 class Directive(entities.Entity, templates.Renderable):
@@ -21,16 +27,31 @@ class Directive(entities.Entity, templates.Renderable):
     name = fields.String()
     situation = fields.String()
     content = fields.String()
+    command = fields.Field(
+        validator=V.ChainOf(
+            V.HomogeneousSequence(
+                item_schema='string',
+                min_length=1,
+                max_length=2,
+            ),
+            V.AdaptTo(tuple),
+        )
+    )
+
+    def get_command(self):
+        """Return the `(action, argument)` (or `(action, )`) command the directive boils down to.
+
+        Only directives generated from links (e.g. `[text](push!place)`) have
+        one; all others return None and must be rendered.
+        """
+        return self.get('command')
 
     def execute(self, context, *args, **kwargs):
         """Execute the directive within the given situation and state.
 
         Return the resulting text and context pair.
         """
-        ctx = dict(context)
-        ctx['args'] = args
-        ctx['kwargs'] = kwargs
-        return self.render(ctx)
+        return self.render(context, args=args, kwargs=kwargs)
 
 
 class Situation(entities.Entity, templates.Renderable):
@@ -40,6 +61,7 @@ class Situation(entities.Entity, templates.Renderable):
     series = fields.String()
     content = fields.String()
     directives = fields.Field(
+        default=frozendict(),
         validator=V.ChainOf(
             V.Mapping(
                 key_schema='string',
@@ -61,6 +83,22 @@ class Situation(entities.Entity, templates.Renderable):
         """
         return (self.series, self.name)
 
+    def get_static_text(self, directive):
+        """Return the text of the given directive (by name), if it is static.
+        """
+        try:
+            return self.directives[directive].static_text
+        except KeyError:
+            return None
+
+    def get_command(self, directive):
+        """Return the native command for the given directive (by name), if any.
+        """
+        try:
+            return self.directives[directive].get_command()
+        except KeyError:
+            return None
+
     def trigger(self, directive, context, *args, **kwargs):
         """Trigger the given directive (by name), executing it in the given context.
 
@@ -142,20 +180,180 @@ class Plot(entities.Entity):
 
         return series_name, situation_name
 
+    @property
+    def addresses(self):
+        """Return the address table, resolved on first use (see `resolve_addresses`).
+        """
+        try:
+            return self._addresses
+        except AttributeError:
+            return self.resolve_addresses()
+
+    def resolve_addresses(self):
+        """Build the address table (see `build_addresses`) and keep it for `addresses`.
+
+        Called when a plot is compiled or loaded, so the first turn needn't.
+        """
+        self._addresses = self.build_addresses()
+        return self._addresses
+
+    def build_addresses(self):
+        """Return a table of every way to address a situation in the plot.
+
+        Maps `series::situation` and `series` addresses, and
+        `(series_name, situation_name)` pairs, to their situations. A
+        `(series_name, None)` or `(series_name, '')` pair, like a bare
+        `series` or `series::` address, names the first situation of the
+        series.
+        """
+        table = {}
+        for series_name, series in self.by_name.iteritems():
+            if series.ordered:
+                first = series.ordered[0]
+                table[series_name] = table[u'{}::'.format(series_name)] = first
+                table[(series_name, None)] = table[(series_name, u'')] = first
+            for situation_name, situation in series.by_name.iteritems():
+                table[(series_name, situation_name)] = situation
+                table[u'{}::{}'.format(series_name, situation_name)] = situation
+        return table
+
+    @property
+    def symbols(self):
+        """Return the plot's symbol table (see `symbols.SymbolTable`), built on first use.
+        """
+        try:
+            return self._symbols
+        except AttributeError:
+            self._symbols = symbols.SymbolTable.from_plot(self)
+            return self._symbols
+
+    @property
+    def version(self):
+        """Return a short hash of the plot's contents and config, built on first use.
+
+        Plots with the same story files and config have the same version.
+        """
+        try:
+            return self._version
+        except AttributeError:
+            digest = hashlib.sha1(json.dumps(self.config.dict(), sort_keys=True))
+            for series_name in sorted(self.by_name):
+                series = self.by_name[series_name]
+                for renderable in [series] + list(series.ordered):
+                    digest.update(u'\0{}\0{}'.format(
+                        renderable.name, renderable.get('content', u'')).encode('utf-8'))
+                    for name in sorted(renderable.get('directives', ())):
+                        digest.update(u'\0{}\0{}'.format(
+                            name, renderable.directives[name].get('content', u'')).encode('utf-8'))
+            self._version = digest.hexdigest()[:12]
+            return self._version
+
+    @property
+    def static_html(self):
+        """Return the HTML pinned for static messages, by message.
+
+        Static messages are added as they are first shown, with None for
+        HTML, which the presenter fills in when it first converts them.
+        `pin_static_html` converts every static message in the plot at once.
+        """
+        try:
+            return self._static_html
+        except AttributeError:
+            return self.__dict__.setdefault('_static_html', {})
+
+    def iter_static_messages(self, renderables=None):
+        """Yield the message each static situation and directive adds, as added to a state.
+        """
+        if renderables is None:
+            renderables = self.iter_renderables()
+        for renderable in renderables:
+            if isinstance(renderable, Series):
+                continue
+            text = renderable.static_text
+            if text is not None:
+                message = text.rstrip().lstrip(u'\n')
+                if message:
+                    yield message
+
+    def pin_static_html(self):
+        """Convert every static message in the plot to HTML, up front.
+        """
+        extensions = self.config['markdown']['extensions']
+        static_html = self.static_html
+        for message in self.iter_static_messages():
+            if static_html.get(message) is None:
+                static_html[message] = presenters.to_html(message, extensions)
+        return static_html
+
+    def copy_static_html(self, plot, replaced=()):
+        """Carry over the HTML pinned for the plot, a previous version of this one.
+
+        Messages of the `replaced` series are left behind, if they were known
+        to be static; finding out would mean parsing their templates.
+        """
+        static_html = dict(plot.static_html)
+        for series in replaced:
+            for situation in series.ordered:
+                renderables = [situation] + list(situation.directives.itervalues())
+                for message in self.iter_static_messages(
+                        r for r in renderables if '_static_text' in r.__dict__):
+                    static_html.pop(message, None)
+        self.__dict__['_static_html'] = static_html
+
+    def situation_for_pair(self, pair):
+        """Return the situation identified by the `(series_name, situation_name)` pair.
+        """
+        return self.addresses[pair]
+
     def get_situation_by_address(self, address, current_situation=None):
         """Return the situation identified by the address.
 
         Address may be a valid address (see `parse_address`, above) or a
         2-tuple of `(series_name, situation_name)`.
         """
-        if isinstance(address, basestring):
-            series_name, situation_name = self.parse_address(address, current_situation)
-        else:
+        addresses = self.addresses
+        if not isinstance(address, basestring):
             # It better be a 2-tuple!
-            series_name, situation_name = address
-
-        series = self.by_name[series_name]
-        return series.by_name[situation_name] if situation_name else series.ordered[0]
+            return addresses[tuple(address)]
+        if current_situation is not None and u'::' not in address:
+            # Is it a situation name in the current series or a series name?
+            situation = addresses.get((current_situation.series, address))
+            if situation is not None:
+                return situation
+        return addresses[address]
 
     def get_start_situation(self):
         return self.get_situation_by_address(self.config['start'])
+
+    def iter_renderables(self):
+        """Yield every series, situation and directive in the plot.
+        """
+        for series in self.by_name.itervalues():
+            yield series
+            for situation in series.ordered:
+                yield situation
+                for directive in situation.directives.itervalues():
+                    yield directive
+
+    def warm(self, threads=None):
+        """Compile every template in the plot up front, instead of on first render.
+
+        This includes finding the context names each template refers to,
+        and pre-rendering static templates to text and HTML.
+
+        With more than one thread, templates are compiled on a thread pool.
+        """
+        renderables = list(self.iter_renderables())
+        if threads is not None and threads > 1:
+            pool = ThreadPool(threads)
+            try:
+                pool.map(operator.attrgetter('template', 'names', 'static_text'), renderables)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for renderable in renderables:
+                renderable.template
+                renderable.names
+                renderable.static_text
+        self.pin_static_html()
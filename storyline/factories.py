@@ -12,6 +12,21 @@ from . import defaults
 from nonobvious import frozendict, frozenlist
 
 
+class SourceSpan(object):
+    """A run of consecutive lines, by byte range in a UTF-8 source buffer.
+    """
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def lines(self):
+        text = self.source[self.start:self.end].decode('utf-8')
+        return [line.rstrip() for line in text.split(u'\n')]
+
+
 class Factory(object):
     kind = 'factory'
 
@@ -22,6 +37,41 @@ class Factory(object):
     def add_line(self, line):
         self.lines.append(line.rstrip())
 
+    def add_span(self, source, start, end):
+        """Add a line by its byte range in the source, without copying it.
+
+        Consecutive lines from the same source are merged into one span.
+        """
+        lines = self.lines
+        if lines:
+            last = lines[-1]
+            if isinstance(last, SourceSpan) and last.source is source and last.end + 1 == start:
+                last.end = end
+                return
+        lines.append(SourceSpan(source, start, end))
+
+    def get_content(self):
+        """Return the content lines joined, decoding any source spans.
+        """
+        lines = []
+        for line in self.lines:
+            if isinstance(line, SourceSpan):
+                lines.extend(line.lines())
+            else:
+                lines.append(line)
+        return u"\n".join(lines)
+
+
+class BuiltFactory(object):
+    """Stand-in factory for an entity that has already been built.
+    """
+    def __init__(self, entity):
+        self.name = entity.name
+        self.entity = entity
+
+    def build(self):
+        return self.entity
+
 
 class PlotFactory(object):
     kind = 'plot'
@@ -35,14 +85,23 @@ class PlotFactory(object):
         self.series.append(factory)
         return factory
 
+    def add_built_series(self, series):
+        """Add a Series entity that has already been built elsewhere.
+        """
+        factory = BuiltFactory(series)
+        self.series.append(factory)
+        return factory
+
     def add_config(self, config):
         self.config.merge(defaults.load_config(config))
 
     def build(self):
-        return entities.Plot(
+        plot = entities.Plot(
             by_name = frozendict((s.name, s.build()) for s in self.series),
             config = self.config,
         )
+        plot.resolve_addresses()
+        return plot
 
 
 class SeriesFactory(Factory):
@@ -61,7 +120,7 @@ class SeriesFactory(Factory):
         situations = frozenlist(s.build() for s in self.situations)
         return entities.Series(
             name = self.name,
-            content = u"\n".join(self.lines),
+            content = self.get_content(),
             by_name = frozendict((s.name, s) for s in situations),
             ordered = situations,
         )
@@ -72,6 +131,9 @@ class SituationFactory(Factory):
 
     link_cp = re.compile(r'\[(?P<text>.+?)\]\((?P<target>.+?)\)', re.MULTILINE)
 
+    # Link actions that PlotState.run_command can apply natively.
+    native_actions = frozenset(('push', 'pop', 'replace', 'select', 'reset', 'trigger'))
+
     def __init__(self, name, series_name):
         super(SituationFactory, self).__init__(name)
         self.series_name = series_name
@@ -107,6 +169,10 @@ class SituationFactory(Factory):
                 )
                 d = self.add_directive(anchor_text)
                 d.add_line(script)
+                if action in self.native_actions:
+                    # The state can run this directly, without rendering the script.
+                    # (Popping takes no argument.)
+                    d.command = (action, ) if action == 'pop' else (action, obj)
                 target = urllib.quote_plus(anchor_text)
 
         return u'[{anchor_text}]({url})'.format(
@@ -120,7 +186,7 @@ class SituationFactory(Factory):
         Return the transformed content which properly address the directives in
         the dict.
         """
-        content = u"\n".join(self.lines)
+        content = self.get_content()
         new_content = []
         start = 0
         # Find all links of the form `[anchor text](directive)`:
@@ -152,10 +218,13 @@ class DirectiveFactory(Factory):
         super(DirectiveFactory, self).__init__(name)
         self.situation_name = situation_name
         self.directives = []
+        self.command = None
 
     def build(self):
+        kwargs = {} if self.command is None else {'command': self.command}
         return entities.Directive(
             name = self.name,
             situation = self.situation_name,
-            content = u'\n'.join(self.lines),
+            content = self.get_content(),
+            **kwargs
         )
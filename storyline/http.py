@@ -1,21 +1,40 @@
 # -*- coding: utf-8 -*-
 """Storyline HTTP server
 
-Usage: storyline start [--listen=ADDRESS] [--debug] STORY_PATH
+Usage:
+  storyline start [--listen=ADDRESS] [--debug] [--bundle=FILE] [--jobs=N] [--stream]
+                  [--warm] [--warm-threads=N] [--modules=ZIP] [--stream-html] [--timing]
+                  STORY_PATH
+  storyline compile [--output=FILE] [--jobs=N] [--stream] [--modules=ZIP] STORY_PATH
 
 Options:
   -h --help             Show this screen.
   --version             Show version.
   -l --listen=ADDRESS   Address and port to listen on [default: localhost:5000]
   -d --debug            Run in DEBUG mode.
+  -b --bundle=FILE      Load the compiled plot bundle FILE when it is newer
+                        than the story files (default: STORY_PATH/plot.bundle)
+  -o --output=FILE      Write the compiled plot bundle to FILE
+                        (default: STORY_PATH/plot.bundle)
+  -j --jobs=N           Parse story files in N worker processes [default: 1]
+  -s --stream           Memory-map story files and parse them lazily
+  -w --warm             Compile every template before serving
+  --warm-threads=N      Compile templates for --warm on N threads [default: 1]
+  -m --modules=ZIP      Import precompiled templates from (or, when compiling,
+                        write them as Python modules to) the zip archive ZIP
+  --stream-html         Send each story page as its messages are converted to
+                        HTML, instead of all at once
+  -t --timing           Time each stage of a turn: send a Server-Timing header
+                        with each response, and serve histograms at /metrics
 """
+import os
 import sys
 import logging
 import urllib
 
 from docopt import docopt
 
-from flask import (Flask, request, session, g, redirect,
+from flask import (Flask, Response, request, session, g, redirect,
                    url_for, abort, render_template, flash)
 
 from watchdog.observers import Observer
@@ -23,18 +42,58 @@ from watchdog.events import LoggingEventHandler
 from watchdog.events import FileSystemEventHandler
 
 from . import storyfile
+from . import bundles
+from . import templates
 from . import serializers
+from . import stores
+from . import caches
 from . import turns
 from . import entities
+from . import timing
 
 
 app = Flask(__name__)
 plot = entities.Plot()
+state_store = stores.CookieStateStore()
+state_cache = None
+stream_html = False
 app.secret_key = 'foobar'
 
 logger = logging.getLogger('http')
 
 
+def stream_template(template_name, **context):
+    """Render a template from the app as an iterator of fragments.
+
+    The template context is gathered now, so the fragments can be rendered
+    after the request is over. (Flask 0.10's `stream_with_context` would
+    reopen the session, losing any changes made to it by the view.)
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return template.generate(context)
+
+
+@app.before_request
+def start_timing():
+    if timing.enabled:
+        timing.start_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    if timing.enabled:
+        response.headers['Server-Timing'] = timing.server_timing(timing.finish_request())
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    if not timing.enabled:
+        abort(404)
+    return Response(timing.metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route("/")
 def hello():
     return "Hello World!"
@@ -45,11 +104,18 @@ def hello():
 def story(action=None):
     logger.debug("########## Starting /story/")
     session.permanent = True
-    state = session.get('state', None)
+    serializer = serializers.get_state_serializer(plot.config)
+    if state_cache is not None:
+        serializer = serializers.CachingStateSerializer(serializer, state_cache)
+    state = state_store.load(session)
     if state is not None:
-        state = serializers.MsgPackStateSerializer.loads(plot, state)
+        try:
+            state = serializer.loads(plot, state)
+        except serializers.StateError as e:
+            logger.warning("Starting over: {}".format(e))
+            state = None
 
-    turn = turns.TurnManager(plot, state)
+    turn = turns.TurnManager(plot, state, stream=stream_html)
 
     action_kwargs = {}
     if request.method == 'POST':
@@ -62,32 +128,105 @@ def story(action=None):
 
     story, state = turn.take_turn(action, **action_kwargs)
 
-    session['state'] = serializers.MsgPackStateSerializer.dumps(state)
+    state_store.save(session, serializer.dumps(state))
 
     logger.debug("########## Fin.")
 
+    if stream_html:
+        # The state is saved, so the session can be sent before the story is.
+        return Response(stream_template('story.html', story=story))
     return render_template('story.html', story=story)
 
 
 @app.route("/reset/", methods=['GET'])
 def reset():
     session.permanent = True
-    session['state'] = u''
-    del session['state']
+    state_store.delete(session)
 
     return redirect(url_for('story'))
 
 
 class Reloader(FileSystemEventHandler):
-    def __init__(self, story_path):
+    def __init__(self, story_path, bundle_path=None, workers=None, stream=False):
         self.path = story_path
+        self.bundle_path = bundle_path
+        self.workers = workers
+        self.stream = stream
         super(Reloader, self).__init__()
 
+    @staticmethod
+    def is_story_file(file_path):
+        """Is this a story file, rather than an editor swap, lock or backup file?
+        """
+        name = os.path.basename(file_path)
+        return name.endswith('.md') and not name.startswith(('.', '#'))
+
+    @staticmethod
+    def is_config_file(file_path):
+        return os.path.basename(file_path) == 'config.ini'
+
     def on_any_event(self, event):
-        if not event.is_directory:
+        if event.is_directory:
+            return
+
+        global plot
+        changed = [event.src_path]
+        if getattr(event, 'dest_path', None):
+            changed.append(event.dest_path)
+
+        if any(self.is_config_file(fp) for fp in changed):
             logger.debug("%s changed. Reloading." % event.src_path)
-            global plot
-            plot = storyfile.load_plot_from_path(self.path)
+            plot = storyfile.load_plot_from_path(
+                self.path, self.bundle_path, self.workers, self.stream)
+            configure_templates(self.path, plot.config)
+            configure_state(self.path, plot.config)
+            return
+
+        new_plot = plot
+        for fp in changed:
+            if self.is_story_file(fp):
+                logger.debug("%s changed. Reloading its series." % fp)
+                new_plot = storyfile.reload_series_from_file(
+                    new_plot, self.path, fp, self.stream)
+        plot = new_plot
+
+
+def configure_templates(story_path, config):
+    """Set up the template bytecode cache and registry from the plot config.
+
+    A relative cache directory is taken relative to the story path.
+    """
+    cache_dir = config['templates']['bytecode_cache']
+    templates.set_bytecode_cache(os.path.join(story_path, cache_dir) if cache_dir else None)
+    templates.registry.resize(config['templates']['registry_size'])
+
+
+def configure_state(story_path, config):
+    """Set up the state store and cache from the plot config.
+
+    Any states kept back by the previous store are written first.
+    """
+    global state_store, state_cache
+    state_store.flush()
+    state_store = stores.get_state_store(config, story_path)
+    cache_size = config['state']['cache_size']
+    state_cache = caches.LRUCache(cache_size) if cache_size else None
+
+
+def compile_bundle(story_path, bundle_path=None, workers=None, stream=False, modules_path=None):
+    """Compile the story at the given path and write it out as a bundle.
+
+    Optionally, also write its templates out as modules in a zip archive.
+    """
+    if bundle_path is None:
+        bundle_path = os.path.join(story_path, bundles.BUNDLE_NAME)
+    # Taken first, so that a source changed while compiling makes the bundle stale.
+    sources = storyfile.get_source_stamps(story_path)
+    plot = storyfile.compile_plot_from_path(story_path, workers, stream)
+    bundles.write_bundle(plot, bundle_path, sources)
+    if modules_path is not None:
+        templates.compile_template_modules(
+            set(r.content for r in plot.iter_renderables()), modules_path)
 
 
 def main():
@@ -103,13 +242,30 @@ def main():
     app.debug = arguments.get('--debug')
 
     story_path = arguments.get('STORY_PATH', '.')
-
-    global plot
-    plot = storyfile.load_plot_from_path(story_path)
+    workers = int(arguments.get('--jobs') or 1)
+    stream = arguments.get('--stream')
+
+    if arguments.get('compile'):
+        compile_bundle(story_path, arguments.get('--output'), workers, stream,
+                       arguments.get('--modules'))
+        return
+
+    bundle_path = arguments.get('--bundle')
+
+    global plot, stream_html
+    plot = storyfile.load_plot_from_path(story_path, bundle_path, workers, stream)
+    configure_templates(story_path, plot.config)
+    configure_state(story_path, plot.config)
+    templates.set_template_modules(arguments.get('--modules'))
+    stream_html = arguments.get('--stream-html')
+    if arguments.get('--timing'):
+        timing.enable()
+    if arguments.get('--warm'):
+        plot.warm(int(arguments.get('--warm-threads') or 1))
 
     observer = Observer()
     observer.schedule(LoggingEventHandler(), path=story_path, recursive=True)
-    observer.schedule(Reloader(story_path), path=story_path, recursive=True)
+    observer.schedule(Reloader(story_path, bundle_path, workers, stream), path=story_path, recursive=True)
 
     observer.start()
     try:
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """storyline.parser -- parser for the storyfile format.
 """
+import re
+import codecs
 import warnings
 import logging
 logger = logging.getLogger('storyline.parser')
@@ -16,19 +18,68 @@ class StoryParser(object):
         '## >': 'directive',
     }
 
+    def __init__(self):
+        # One regex for all the line prefixes, longest first, so that a line
+        # is classified with a single match instead of a scan of event_map.
+        prefixes = sorted(self.event_map, key=len, reverse=True)
+        self.prefix_cp = re.compile(u'|'.join(re.escape(p) for p in prefixes))
+        self.handlers = dict(
+            (event, getattr(self, 'on_' + event))
+            for event in set(self.event_map.itervalues()) | set(['line'])
+        )
+
+    def tokenize(self, storydef):
+        """Yield an `(event, line)` pair for every line in the story definition.
+        """
+        match = self.prefix_cp.match
+        event_map = self.event_map
+        for line in storydef.splitlines():
+            m = match(line)
+            yield (event_map[m.group()] if m is not None else 'line'), line
+
     def parse(self, state, name, storydef):
         state.add_series(name)
-        for line in storydef.splitlines():
-            self.parse_line(state, line)
+        handlers = self.handlers
+        for event, line in self.tokenize(storydef):
+            handlers[event](state, line)
+
+    def tokenize_stream(self, source):
+        """Yield an `(event, start, end)` triple for every line in the source.
+
+        The source is a buffer of UTF-8 bytes, such as an mmap; lines are
+        found lazily, and identified by their byte range in the buffer.
+        """
+        match = self.prefix_cp.match
+        event_map = self.event_map
+        find = source.find
+        size = len(source)
+        start = 3 if source[:3] == codecs.BOM_UTF8 else 0
+        while start < size:
+            end = find('\n', start)
+            if end == -1:
+                end = size
+            m = match(source, start, end)
+            yield (event_map[m.group()] if m is not None else 'line'), start, end
+            start = end + 1
+
+    def parse_stream(self, state, name, source):
+        """Parse a story definition from a buffer of UTF-8 bytes.
+
+        Content lines are handed to the state as byte ranges of the source,
+        which must stay open until the state is compiled.
+        """
+        state.add_series(name)
+        handlers = self.handlers
+        for event, start, end in self.tokenize_stream(source):
+            if event == 'line':
+                state.add_span(source, start, end)
+            else:
+                handlers[event](state, source[start:end].decode('utf-8'))
 
     def parse_line(self, state, line):
-        for key in self.event_map:
-            if line.startswith(key):
-                handler = getattr(self, 'on_' + self.event_map[key])
-                handler(state, line)
-                break
-        else:
-            self.on_line(state, line)
+        m = self.prefix_cp.match(line)
+        event = self.event_map[m.group()] if m is not None else 'line'
+        self.handlers[event](state, line)
 
     def on_line(self, state, line):
         state.add_line(line)
@@ -58,6 +109,9 @@ class ParserState(object):
     def add_line(self, line):
         self.factories[-1].add_line(line)
 
+    def add_span(self, source, start, end):
+        self.factories[-1].add_span(source, start, end)
+
     def pop_all(self):
         self.pop_all_but()
 
@@ -93,6 +147,6 @@ class ParserState(object):
     def compile(self, config=None):
         """Return the compiled plot.
         """
-        if config is None:
+        if config is not None:
             self.plot.add_config(config)
         return self.plot.build()
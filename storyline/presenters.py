@@ -1,8 +1,95 @@
 # -*- coding: utf-8 -*-
 """storyline.presenters -- presenters for rendering raw messages into output.
 """
+import hashlib
+import threading
+
+import markdown
+from typogrify.filters import typogrify
+
+from . import caches
+
+html_cache = caches.LRUCache(4096)
+
+local = threading.local()
+
+
+def get_markdown(extensions=()):
+    """Return this thread's Markdown converter for the extensions.
+
+    Loading extensions costs more than converting a short message, so each
+    thread keeps one converter per set of extensions, and reuses it.
+    """
+    extensions = tuple(extensions)
+    try:
+        converters = local.converters
+    except AttributeError:
+        converters = local.converters = {}
+    try:
+        return converters[extensions]
+    except KeyError:
+        converter = converters[extensions] = markdown.Markdown(extensions=list(extensions))
+        return converter
+
+
+def convert_markdown(message, extensions=()):
+    """Convert a message to HTML with Markdown.
+    """
+    converter = get_markdown(extensions)
+    try:
+        return converter.convert(message)
+    finally:
+        converter.reset()
+
+
+def to_html(message, extensions=()):
+    """Convert a message to HTML with Markdown and typogrify.
+    """
+    return typogrify(convert_markdown(message, extensions))
 
 
 class HTMLPresenter(object):
-    def __init__(self, messages):
-        self.messages = messages
+    """Renders messages to HTML with Markdown and typogrify, one at a time.
+
+    The HTML for each message is cached by a hash of the message and the
+    Markdown extensions used, so a message seen before, by any player, is
+    not converted again. HTML for messages that are always worth keeping
+    can be given as `pinned`, a dict by message, which is never evicted.
+    Messages pinned with None for HTML are converted once, and kept there.
+    """
+    def __init__(self, extensions=(), cache=None, pinned=None):
+        self.extensions = tuple(extensions)
+        self.cache = html_cache if cache is None else cache
+        self.pinned = {} if pinned is None else pinned
+
+    def render(self, message):
+        """Return the HTML for a single message.
+        """
+        html = self.pinned.get(message)
+        if html is not None:
+            return html
+        source = message.encode('utf-8') if isinstance(message, unicode) else message
+        key = (hashlib.sha1(source).digest(), self.extensions)
+        html = self.cache.get(key)
+        if html is None:
+            html = to_html(message, self.extensions)
+            self.cache.set(key, html)
+        if message in self.pinned:
+            self.pinned[message] = html
+        return html
+
+    def iter_present(self, messages):
+        """Yield the HTML for the messages, in order, as each is converted.
+
+        Joined together, the fragments are the output of `present`.
+        """
+        separator = u''
+        for message in messages:
+            if message is not None and message.strip():
+                yield separator + self.render(message)
+                separator = u'\n'
+
+    def present(self, messages):
+        """Return the HTML for all the messages, in order.
+        """
+        return u''.join(self.iter_present(messages))
@@ -1,8 +1,35 @@
 # -*- coding: utf-8 -*-
 """storyline.serializers
 """
+import hashlib
+import functools
 import collections
 from . import states
+from .symbols import get_table as get_symbol_table
+
+
+class StateError(ValueError):
+    """The serialized state can't be loaded for this plot.
+    """
+    pass
+
+
+def raises_state_error(loads):
+    """Wrap a serializer's `loads` to raise StateError for any state it can't load.
+
+    That includes states written by another serializer, or that don't
+    validate for the plot.
+    """
+    @functools.wraps(loads)
+    def wrapper(cls, plot, serialized):
+        from msgpack.exceptions import UnpackException
+        try:
+            return loads(cls, plot, serialized)
+        except StateError:
+            raise
+        except (UnpackException, TypeError, ValueError, AttributeError, KeyError, IndexError) as e:
+            raise StateError("Can't load state: {!r}".format(e))
+    return wrapper
 
 
 class StateSerializer(object):
@@ -32,6 +59,7 @@ class MsgPackStateSerializer(object):
             return obj
 
     @classmethod
+    @raises_state_error
     def loads(cls, plot, serialized):
         """Load state from a msgpack-serialized string.
         """
@@ -45,3 +73,197 @@ class MsgPackStateSerializer(object):
         """
         import msgpack
         return msgpack.packb(state, default=cls._encode_object)
+
+
+class CompactMsgPackStateSerializer(MsgPackStateSerializer):
+    """MsgPack serializer/deserializer using the plot's symbol table.
+
+    Situations are stored as ids and flags as a bitset (see
+    `storyline.symbols`). States dumped for an earlier version of the plot
+    are read with its symbol table, if this process made it, as long as
+    their situations are still in the plot. Otherwise, they raise
+    StateError.
+    """
+    @classmethod
+    @raises_state_error
+    def loads(cls, plot, serialized):
+        """Load state from a compact msgpack-serialized string.
+        """
+        import msgpack
+        symbols = plot.symbols
+        try:
+            (version, stack, situation, flags, extra_flags,
+             this, locations, messages) = msgpack.unpackb(serialized)
+        except (TypeError, ValueError):
+            raise StateError("Not a compact state.")
+        if version != symbols.version:
+            symbols = get_symbol_table(version)
+            if symbols is None:
+                raise StateError("State is for an unknown version of the plot.")
+        stack = [symbols.unpack_pair(pair) for pair in stack]
+        situation = symbols.unpack_pair(situation)
+        if symbols is not plot.symbols:
+            for pair in stack + ([situation] if situation is not None else []):
+                if tuple(pair) not in plot.addresses:
+                    raise StateError("State is in a situation no longer in the plot.")
+        return states.PlotState(
+            plot,
+            stack = stack,
+            situation = situation,
+            messages = messages,
+            flags = symbols.unpack_flags(flags, extra_flags),
+            this = this,
+            locations = locations,
+        )
+
+    @classmethod
+    def dumps(cls, state):
+        """Dump state to a compact msgpack-serialized string.
+        """
+        import msgpack
+        symbols = state.plot.symbols
+        flags, extra_flags = symbols.pack_flags(state.flags)
+        return msgpack.packb(
+            [
+                symbols.version,
+                [symbols.pack_pair(pair) for pair in state.stack],
+                symbols.pack_pair(state.situation),
+                flags,
+                extra_flags,
+                state.this,
+                state.locations,
+                state.messages,
+            ],
+            default = cls._encode_object,
+        )
+
+
+class DeltaMsgPackStateSerializer(MsgPackStateSerializer):
+    """MsgPack serializer/deserializer storing only what differs from a baseline.
+
+    The baseline is the plot's start state (see `states.get_start_state`),
+    referenced by a short hash of its contents. Changes to `this` and
+    `locations` are stored key by key, and to `flags` as additions and
+    removals. If the delta is no smaller than the whole state, the whole
+    state is stored instead. Deltas against another baseline can't be
+    loaded, and raise StateError.
+    """
+    mapping_fields = ('this', 'locations')
+
+    @classmethod
+    def get_baseline(cls, plot):
+        """Return the baseline state for the plot, and its key.
+
+        Both are worked out once per plot.
+        """
+        try:
+            return plot._delta_baseline
+        except AttributeError:
+            baseline = states.get_start_state(plot)
+            key = hashlib.sha1(MsgPackStateSerializer.dumps(baseline)).hexdigest()[:8]
+            plot._delta_baseline = (baseline, key)
+            return plot._delta_baseline
+
+    @classmethod
+    @raises_state_error
+    def loads(cls, plot, serialized):
+        """Load state from a delta- or fully-serialized msgpack string.
+        """
+        import msgpack
+        try:
+            key, data = msgpack.unpackb(serialized)
+        except (TypeError, ValueError):
+            raise StateError("Not a delta state.")
+        if not key:
+            return states.PlotState(plot, data)
+
+        baseline, baseline_key = cls.get_baseline(plot)
+        if key != baseline_key:
+            raise StateError("State is for another version of the plot.")
+
+        fields = dict(baseline)
+        for name, change in data.iteritems():
+            if name in cls.mapping_fields:
+                changed, removed = change
+                value = dict(baseline[name])
+                for k in removed:
+                    value.pop(k, None)
+                value.update(changed)
+                fields[name] = value
+            elif name == 'flags':
+                added, removed = change
+                fields[name] = set(baseline.flags).union(added).difference(removed)
+            else:
+                fields[name] = change
+        return states.PlotState(plot, fields)
+
+    @classmethod
+    def dumps(cls, state):
+        """Dump state to a delta-serialized msgpack string.
+        """
+        import msgpack
+        baseline, key = cls.get_baseline(state.plot)
+        delta = {}
+        for name, value in state.iteritems():
+            base = baseline.get(name)
+            if value == base:
+                continue
+            if name in cls.mapping_fields:
+                delta[name] = [
+                    dict((k, v) for k, v in value.iteritems() if k not in base or base[k] != v),
+                    [k for k in base if k not in value],
+                ]
+            elif name == 'flags':
+                delta[name] = [sorted(value - base), sorted(base - value)]
+            else:
+                delta[name] = value
+
+        packed = msgpack.packb([key, delta], default=cls._encode_object)
+        full = msgpack.packb(['', state], default=cls._encode_object)
+        return packed if len(packed) < len(full) else full
+
+
+class CachingStateSerializer(object):
+    """Wraps a state serializer with an LRU cache of loaded states.
+
+    States are cached by plot version and a digest of their serialized
+    form, both when loaded and when dumped, so a state sent back by a
+    player is loaded without being decoded and validated again. States are
+    immutable, so one can be shared between request threads.
+    """
+    def __init__(self, serializer, cache):
+        self.serializer = serializer
+        self.cache = cache
+
+    def get_key(self, plot, serialized):
+        return plot.version, hashlib.sha1(serialized).digest()
+
+    def loads(self, plot, serialized):
+        """Load state from a serialized string, from the cache if possible.
+        """
+        key = self.get_key(plot, serialized)
+        state = self.cache.get(key)
+        if state is None or state.plot is not plot:
+            state = self.serializer.loads(plot, serialized)
+            self.cache.set(key, state)
+        return state
+
+    def dumps(self, state):
+        """Dump state to a serialized string, caching the state for it.
+        """
+        serialized = self.serializer.dumps(state)
+        self.cache.set(self.get_key(state.plot, serialized), state)
+        return serialized
+
+
+state_serializers = {
+    'msgpack': MsgPackStateSerializer,
+    'compact': CompactMsgPackStateSerializer,
+    'delta': DeltaMsgPackStateSerializer,
+}
+
+
+def get_state_serializer(config):
+    """Return the state serializer chosen in the plot config.
+    """
+    return state_serializers[config['state']['serializer']]
@@ -10,7 +10,7 @@ from nonobvious import entities, fields
 from nonobvious import frozendict, frozenlist, frozenset
 from nonobvious import V
 
-from .contexts import ContextSet, ContextState, ContextList
+from .contexts import ContextSet, ContextState, ContextList, ContextLocations, LazyContext
 
 
 simple_value_frozendict = V.ChainOf(
@@ -35,6 +35,128 @@ situation_tuple = V.ChainOf(
 )
 
 
+def queue_command(context, *command):
+    """Queue the command in the context, for `Transition.from_context`.
+    """
+    context['commands'].append(command)
+    return u''
+
+
+class StateContext(LazyContext):
+    """The template context for a situation, built from a state's values.
+
+    Templates change state by mutating the context objects and queueing
+    commands, which `Transition.from_context` then takes up. Only the
+    values a template looks up are built.
+    """
+    def __init__(self, situation, this, flags, locations):
+        super(StateContext, self).__init__()
+        self.situation = situation
+        self.state_this = this
+        self.state_flags = flags
+        self.state_locations = locations
+
+    builders = {
+        'this': lambda ctx: ContextState(ctx.state_this),
+
+        # Local context object synonyms
+        'its': lambda ctx: ctx['this'],
+        'I': lambda ctx: ctx['this'],
+        'my': lambda ctx: ctx['this'],
+        'we': lambda ctx: ctx['this'],
+        'our': lambda ctx: ctx['this'],
+        'he': lambda ctx: ctx['this'],
+        'his': lambda ctx: ctx['this'],
+        'she': lambda ctx: ctx['this'],
+
+        'here': lambda ctx: ctx['elsewhere'].location(ctx.situation.address),
+        'elsewhere': lambda ctx: ContextLocations(ctx.state_locations),
+
+        'flags': lambda ctx: ContextSet(ctx.state_flags),
+        'commands': lambda ctx: ContextList(),
+
+        # Local context actions
+        'push': lambda ctx: lambda a: queue_command(ctx, 'push', a),
+        'pop': lambda ctx: lambda a=None: queue_command(ctx, 'pop'),
+        'replace': lambda ctx: lambda a: queue_command(ctx, 'replace', a),
+        'select': lambda ctx: lambda a: queue_command(ctx, 'replace', a),
+        'reset': lambda ctx: lambda a=None: queue_command(ctx, 'reset', a),
+        'trigger': lambda ctx: lambda a: queue_command(ctx, 'trigger', a),
+    }
+
+
+class MessageBuffer(collections.Sequence):
+    """An immutable sequence of messages with constant-time `append`.
+
+    `append` returns a new buffer that shares every existing message with
+    this one, so adding a message costs the same however many are already
+    buffered. The messages are only collected, in order, when the buffer
+    is iterated.
+    """
+    def __init__(self, messages=()):
+        node = None
+        length = 0
+        for message in messages:
+            node = (message, node)
+            length += 1
+        self._node = node
+        self._length = length
+
+    def append(self, message):
+        """Return a new buffer with the message added at the end.
+        """
+        new_buffer = self.__class__.__new__(self.__class__)
+        new_buffer._node = (message, self._node)
+        new_buffer._length = self._length + 1
+        return new_buffer
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return reversed(self._reversed())
+
+    def __reversed__(self):
+        return iter(self._reversed())
+
+    def _reversed(self):
+        messages = []
+        node = self._node
+        while node is not None:
+            message, node = node
+            messages.append(message)
+        return messages
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long)) and -self._length <= index < 0:
+            # Counting back from the end is the cheap direction.
+            node = self._node
+            for _ in xrange(-index - 1):
+                node = node[1]
+            return node[0]
+        return list(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, collections.Sequence) and not isinstance(other, basestring):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, list(self))
+
+
+message_buffer = V.ChainOf(
+    V.HomogeneousSequence(item_schema='string'),
+    V.AdaptTo(MessageBuffer),
+)
+
+
 class PlotState(entities.Entity):
     stack = fields.Field(
         default = (),
@@ -50,7 +172,10 @@ class PlotState(entities.Entity):
             lambda x: x is None,
             situation_tuple,
         ))
-    messages = fields.StringList(default=())
+    messages = fields.Field(
+        default = (),
+        validator = message_buffer,
+    )
     flags = fields.Field(
         default = (),
         validator = V.ChainOf(
@@ -94,82 +219,251 @@ class PlotState(entities.Entity):
         """
         return self.__class__(self.plot, self, *args, **kwargs)
 
+    def _evolve(self, **changes):
+        """Return a shallow copy with the given members replaced, without validation.
+
+        For transitions within the state machine only: the changes must
+        already be in their validated form (tuples, frozenlists, frozensets
+        and frozendicts). Anything from outside the state machine goes
+        through `copy`.
+        """
+        new_state = self.__class__.__new__(self.__class__)
+        dict.update(new_state, self)
+        dict.update(new_state, changes)
+        new_state.plot = self.plot
+        return new_state
+
+    def transition(self):
+        """Return a Transition from this state, to apply several steps at once.
+        """
+        return Transition(self)
+
     def as_context(self):
-        commands = ContextList()
-        situation = situation = self.plot.get_situation_by_address(self.situation)
-        flags = ContextSet(self.flags)
-        this = ContextState(self.this)
-        locations = ContextState(
-            (name, ContextState(value))
-            for name, value in self.locations.iteritems()
+        return StateContext(
+            self.plot.situation_for_pair(self.situation),
+            self.this, self.flags, self.locations,
         )
 
-        return {
-            # Local context object synonyms
-            'this': this,
-            'its': this,
-            'I': this,
-            'my': this,
-            'we': this,
-            'our': this,
-            'he': this,
-            'his': this,
-            'she': this,
-
-            'here': locations.get(situation.address, ContextState()),
-            'elsewhere': locations,
-
-            'flags': flags,
-            'commands': commands,
-
-            # Local context actions
-            'push': lambda a: commands.append(('push', a)) or u'',
-            'pop': lambda a=None: commands.append(('pop', )) or u'',
-            'replace': lambda a: commands.append(('replace', a)) or u'',
-            'select': lambda a: commands.append(('replace', a)) or u'',
-            'reset': lambda a=None: commands.append(('reset', a)) or u''
-        }
-
-    valid_commands = set(('push', 'pop', 'replace', 'reset'))
+    def run_command(self, command):
+        """Apply a `(method, arg, ...)` command, as queued by a directive.
+        """
+        return self.transition().run_command(command).freeze()
 
     def from_context(self, context):
-        new_state = self.copy(
-            this = context.get('this', self.this),
-            locations = context.get('locations', self.locations),
-            flags = context.get('flags', self.flags),
-        )
-        for command in context.get('commands', ()):
-            method = command[0]
-            args = command[1:]
-            new_state = getattr(new_state, method)(*args)
-        return new_state
+        return self.transition().from_context(context).freeze()
 
     def clear_messages(self):
         """Clear the message output buffer.
         """
-        return self.copy(messages=())
+        return self._evolve(messages=MessageBuffer())
 
     def add_message(self, message):
         """Add a message to the output buffer.
         """
         if message and message.strip():
-            message = message.rstrip().lstrip(u'\n')
-            logger.debug("New message:\n {}\n".format(message))
-            logger.debug("Messages: {}".format(self.messages))
-            return self.copy(messages=self.messages+[message])
+            return self.transition().add_message(message).freeze()
+        else:
+            return self
+
+    def trigger(self, directive, *args, **kwargs):
+        """Execute the named directive on the current situation.
+        """
+        return self.transition().trigger(directive, *args, **kwargs).freeze()
+
+    def render_situation(self):
+        return self.transition().render_situation().freeze()
+
+    def push(self, situation):
+        """Push the situation (by address) onto the stack.
+        """
+        return self.transition().push(situation).freeze()
+
+    def pop(self):
+        """Pop the current situation off the stack.
+        """
+        return self.transition().pop().freeze()
+
+    def replace(self, situation):
+        """Replace the current situation on the stick with the named situation.
+        """
+        return self.transition().replace(situation).freeze()
+
+    def reset(self, situation=None):
+        """Clear the stack and start fresh with the named situation.
+        """
+        return self.transition().reset(situation).freeze()
+
+    def _enter(self, situation=None, exit=True):
+        return self.transition()._enter(situation, exit).freeze()
+
+    def _exit(self):
+        if self.situation is not None:
+            return self.transition()._exit().freeze()
+        return self
+
+    def current(self):
+        """Return the current situation of the plot.
+        """
+        top = self.top
+        if top is not None:
+            return self.plot.situation_for_pair(top)
+        else:
+            return None
+
+
+def get_start_state(plot):
+    """Return the state in which every story of the plot starts, sans messages.
+
+    The state is built once per plot.
+    """
+    try:
+        return plot._start_state
+    except AttributeError:
+        plot._start_state = PlotState(plot).push(plot.get_start_situation()).clear_messages()
+        return plot._start_state
+
+
+field_validators = dict(
+    (name, V.parse(field.validator))
+    for name, field in PlotState.fields.iteritems()
+)
+
+
+class Transition(object):
+    """A PlotState in the middle of a turn.
+
+    Each step of the turn -- commands, exits and entrances, and the messages
+    they render -- updates the transition in place, and `freeze` produces
+    the single resulting PlotState, rather than one state per step.
+    """
+    valid_commands = set(('push', 'pop', 'replace', 'reset', 'trigger'))
+    command_aliases = {'select': 'replace'}
+
+    def __init__(self, state):
+        self.state = state
+        self.plot = state.plot
+        self.stack = list(state.stack)
+        self.situation = state.situation
+        self.messages = state.messages
+        self.flags = state.flags
+        self.this = state.this
+        self.locations = state.locations
+
+    def freeze(self):
+        """Return the PlotState resulting from the transition.
+        """
+        return self.state._evolve(
+            stack = frozenlist(self.stack),
+            situation = self.situation,
+            messages = self.messages,
+            flags = self.flags,
+            this = self.this,
+            locations = self.locations,
+        )
+
+    @property
+    def top(self):
+        """Return the top situation in the stack.
+        """
+        try:
+            return self.stack[-1]
+        except IndexError:
+            return None
+
+    def current(self):
+        """Return the current situation of the plot.
+        """
+        top = self.top
+        if top is not None:
+            return self.plot.situation_for_pair(top)
         else:
+            return None
+
+    def as_context(self):
+        return StateContext(
+            self.plot.situation_for_pair(self.situation),
+            self.this, self.flags, self.locations,
+        )
+
+    def run_command(self, command):
+        """Apply a `(method, arg, ...)` command, as queued by a directive.
+        """
+        method = self.command_aliases.get(command[0], command[0])
+        if method not in self.valid_commands:
+            raise ValueError("Unknown command {!r}".format(command))
+        return getattr(self, method)(*command[1:])
+
+    def from_context(self, context):
+        """Take up the changes a template made to the context, then run its commands.
+
+        Context values come from templates, so they are validated here. Of a
+        lazy context, only the values the template looked up are read.
+        """
+        if isinstance(context, LazyContext):
+            context = context.built
+        for name in ('this', 'locations', 'flags'):
+            if name in context:
+                setattr(self, name, field_validators[name].validate(context[name]))
+        if 'elsewhere' in context:
+            self.update_locations(*context['elsewhere'].changes())
+        for command in context.get('commands', ()):
+            self.run_command(command)
+        return self
+
+    def update_locations(self, changed, deleted=()):
+        """Replace the changed locations and drop the deleted ones.
+
+        Only the changed locations are validated and frozen; the others are
+        carried over as they are.
+        """
+        if not (changed or deleted):
             return self
+        locations = dict(self.locations)
+        for name in deleted:
+            del locations[name]
+        locations.update(
+            field_validators['locations'].validate(changed)
+        )
+        self.locations = frozendict(locations)
+        return self
+
+    def add_message(self, message, static=False):
+        """Add a message to the output buffer.
+
+        A `static` message (see `Renderable.static_text`) has its HTML pinned
+        by the presenter; see `Plot.static_html`.
+        """
+        if message and message.strip():
+            message = message.rstrip().lstrip(u'\n')
+            logger.debug("New message:\n %s\n", message)
+            if static:
+                self.plot.static_html.setdefault(message, None)
+            self.messages = self.messages.append(message)
+        return self
 
     def trigger(self, directive, *args, **kwargs):
         """Execute the named directive on the current situation.
         """
+        situation = self.current()
+        command = situation.get_command(directive)
+        if command is not None:
+            # A generated link directive: skip rendering and apply it directly.
+            return self.run_command(command)
+        text = situation.get_static_text(directive)
+        if text is not None:
+            # A static directive: nothing to render and no context to apply.
+            return self.add_message(text, static=True)
+
         ctx = self.as_context()
-        message = self.current().trigger(directive, ctx, *args, **kwargs)
+        message = situation.trigger(directive, ctx, *args, **kwargs)
         return self.from_context(ctx).add_message(message)
 
     def render_situation(self):
+        situation = self.current()
+        if situation.static_text is not None:
+            return self.add_message(situation.static_text, static=True)
         ctx = self.as_context()
-        message = self.current().render(ctx)
+        message = situation.render(ctx)
         return self.from_context(ctx).add_message(message)
 
     def push(self, situation):
@@ -177,28 +471,28 @@ class PlotState(entities.Entity):
         """
         if isinstance(situation, basestring):
             situation = self.plot.get_situation_by_address(situation, self.current())
-        new_state = self._exit()
-        new_state = new_state.copy(stack = new_state.stack + [situation.pair])
-        return new_state._enter(situation, exit=False)
+        self._exit()
+        self.stack.append(situation.pair)
+        return self._enter(situation, exit=False)
 
     def pop(self):
         """Pop the current situation off the stack.
         """
-        new_state = self._exit()
-        new_state = new_state.copy(stack=new_state.stack[:-1])
-        if not new_state.stack:
-            return new_state.push(self.plot.config['start'])
+        self._exit()
+        del self.stack[-1:]
+        if not self.stack:
+            return self.push(self.plot.config['start'])
         else:
-            return new_state._enter()
+            return self._enter()
 
     def replace(self, situation):
         """Replace the current situation on the stick with the named situation.
         """
         if isinstance(situation, basestring):
             situation = self.plot.get_situation_by_address(situation, self.current())
-        new_state = self._exit()
-        new_state = new_state.copy(stack = new_state.stack[:-1] + [situation.pair])
-        return new_state._enter(situation, exit=False)
+        self._exit()
+        self.stack[-1:] = [situation.pair]
+        return self._enter(situation, exit=False)
 
     def reset(self, situation=None):
         """Clear the stack and start fresh with the named situation.
@@ -207,43 +501,30 @@ class PlotState(entities.Entity):
             situation = self.plot.config['start']
         if isinstance(situation, basestring):
             situation = self.plot.get_situation_by_address(situation, self.current())
-        new_state = self._exit()
+        self._exit()
 
         # Clear all state
-        new_state = new_state.copy(
-            stack = [situation.pair],
-            situation = None,
-            flags = (),
-            this = {},
-            locations = {},
-        )
+        self.stack = [situation.pair]
+        self.situation = None
+        self.flags = frozenset()
+        self.this = frozendict()
+        self.locations = frozendict()
 
-        return new_state._enter(situation, exit=False)
+        return self._enter(situation, exit=False)
 
     def _enter(self, situation=None, exit=True):
-        new_state = self
         if situation is None:
-            series, situation = self.top
-        if isinstance(situation, basestring):
+            situation = self.current()
+        elif isinstance(situation, basestring):
             situation = self.plot.get_situation_by_address(situation, self.current())
         if exit:
-            new_state = self._exit()
-        new_state = new_state.copy(situation=situation.pair)
-        new_state = new_state.trigger('on_enter')
-        new_state = new_state.render_situation()
-        return new_state
+            self._exit()
+        self.situation = situation.pair
+        self.trigger('on_enter')
+        return self.render_situation()
 
     def _exit(self):
         if self.situation is not None:
-            new_state = self.trigger('on_exit')
-            return new_state.copy(situation=None)
+            self.trigger('on_exit')
+            self.situation = None
         return self
-
-    def current(self):
-        """Return the current situation of the plot.
-        """
-        top = self.top
-        if top is not None:
-            return self.plot.get_situation_by_address(self.top)
-        else:
-            return None
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""storyline.stores -- where serialized story state is kept between requests.
+"""
+import os
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+import logging
+logger = logging.getLogger('storyline.stores')
+
+
+class StateStore(object):
+    """Keeps serialized state for a (Flask-style, dict-like) session.
+    """
+    def load(self, session):
+        """Return the serialized state for the session, or None.
+        """
+        raise NotImplementedError()
+
+    def save(self, session, serialized):
+        """Keep the serialized state for the session.
+        """
+        raise NotImplementedError()
+
+    def delete(self, session):
+        """Forget the session's state.
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        """Write any states kept back, e.g. before the store is replaced.
+        """
+        pass
+
+
+class CookieStateStore(StateStore):
+    """Keeps the whole serialized state in the session itself.
+    """
+    key = 'state'
+
+    def load(self, session):
+        return session.get(self.key, None)
+
+    def save(self, session, serialized):
+        session[self.key] = serialized
+
+    def delete(self, session):
+        session.pop(self.key, None)
+
+
+class SQLiteStateStore(StateStore):
+    """Keeps serialized state in a SQLite database; the session only holds an id.
+
+    The database is opened in write-ahead logging mode, with a connection
+    per thread. Saves are queued and written `batch_size` at a time, in one
+    transaction; queued states are served from memory until then, and
+    written at exit. With more than one server process, use a batch size
+    of 1, as processes can't see each other's queued states.
+
+    Like the cookies they replace, states expire: those not written for
+    `max_age` seconds (if not 0) are no longer loaded, and are deleted
+    when a batch is written, at most once every `prune_interval` seconds.
+    """
+    key = 'state_id'
+    prune_interval = 3600
+
+    def __init__(self, path, batch_size=1, max_age=0):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.pending = {}
+        self.last_pruned = 0
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS states "
+                "(id TEXT PRIMARY KEY, state BLOB NOT NULL, written REAL NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(states)")]
+            if 'written' not in columns:
+                # A database from before states expired.
+                self.connection.execute(
+                    "ALTER TABLE states ADD COLUMN written REAL NOT NULL DEFAULT 0")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS states_written ON states (written)")
+        atexit.register(self.flush)
+
+    @property
+    def connection(self):
+        """Return this thread's connection to the database.
+        """
+        try:
+            return self.local.connection
+        except AttributeError:
+            connection = self.local.connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            return connection
+
+    def load(self, session):
+        state_id = session.get(self.key)
+        if state_id is None:
+            return None
+        with self.lock:
+            if state_id in self.pending:
+                return self.pending[state_id]
+        row = self.connection.execute(
+            "SELECT state FROM states WHERE id = ? AND written >= ?",
+            (state_id, self.get_cutoff())
+        ).fetchone()
+        return str(row[0]) if row is not None else None
+
+    def save(self, session, serialized):
+        state_id = session.get(self.key)
+        if state_id is None:
+            state_id = session[self.key] = unicode(uuid.uuid4().hex)
+        with self.lock:
+            self.pending[state_id] = serialized
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def delete(self, session):
+        state_id = session.pop(self.key, None)
+        if state_id is None:
+            return
+        with self.write_lock:
+            with self.lock:
+                self.pending.pop(state_id, None)
+            with self.connection:
+                self.connection.execute("DELETE FROM states WHERE id = ?", (state_id, ))
+
+    def get_cutoff(self):
+        """Return the time before which states written have expired.
+        """
+        return time.time() - self.max_age if self.max_age else 0
+
+    def write(self, batch):
+        """Write a dict of serialized states, by id, in one transaction.
+        """
+        logger.debug("Writing %d states", len(batch))
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO states (id, state, written) VALUES (?, ?, ?)",
+                [
+                    (state_id, sqlite3.Binary(serialized), now)
+                    for state_id, serialized in batch.iteritems()
+                ]
+            )
+
+    def prune(self):
+        """Delete expired states.
+        """
+        self.last_pruned = time.time()
+        with self.connection:
+            deleted = self.connection.execute(
+                "DELETE FROM states WHERE written < ?", (self.get_cutoff(), )
+            ).rowcount
+        logger.debug("Pruned %d expired states", deleted)
+
+    def flush(self):
+        """Write all queued states now.
+
+        States stay queued, and so visible to `load`, until they are written.
+        """
+        with self.write_lock:
+            with self.lock:
+                batch = dict(self.pending)
+            if not batch:
+                return
+            self.write(batch)
+            if self.max_age and time.time() - self.last_pruned >= self.prune_interval:
+                self.prune()
+            with self.lock:
+                for state_id, serialized in batch.iteritems():
+                    if self.pending.get(state_id) is serialized:
+                        del self.pending[state_id]
+
+
+def get_state_store(config, story_path='.'):
+    """Return the state store chosen in the plot config.
+
+    A relative SQLite database path is taken relative to the story path.
+    """
+    state_config = config['state']
+    if state_config['store'] == 'sqlite':
+        return SQLiteStateStore(
+            os.path.join(story_path, state_config['sqlite_path']),
+            state_config['batch_size'],
+            state_config['max_age'],
+        )
+    return CookieStateStore()
@@ -1,30 +1,210 @@
 # -*- coding: utf-8 -*-
 """storyline.storyfile -- reader for the special storyfile format.
 """
+import os
+import mmap
 import logging
+import traceback
+import multiprocessing
 logger = logging.getLogger('storyline.storyfile')
 
 from path import path
 from configobj import ConfigObj
 
 from . import defaults
+from . import bundles
 from . parser import StoryParser, ParserState
 
 
-def load_plot_from_path(story_path):
-    """Load all the series definitions in the given path.
+def iter_source_paths(story_path):
+    """Yield the paths of all the source files that make up the plot.
+    """
+    p = path(story_path).expand().abspath()
+    for fp in p.walkfiles('*.md'):
+        yield fp
+    CONFIG = p / 'config.ini'
+    if CONFIG.exists():
+        yield CONFIG
+
+
+def get_source_stamps(story_path):
+    """Return the modification time of each source file, by path relative to the story path.
+    """
+    p = path(story_path).expand().abspath()
+    return dict(
+        (unicode(p.relpathto(fp)), fp.getmtime())
+        for fp in iter_source_paths(p)
+    )
+
+
+def bundle_is_fresh(bundle_path, story_path):
+    """Return True if the bundle exists and was compiled from the sources as they are now.
+
+    That is, the same source files, none of them modified since; a source
+    file added, deleted or replaced (even by an older one) makes it stale.
+    """
+    bundle_path = path(bundle_path)
+    if not bundle_path.isfile():
+        return False
+    try:
+        sources = bundles.read_bundle_sources(bundle_path)
+    except bundles.BundleError:
+        return False
+    return sources == get_source_stamps(story_path)
+
+
+def get_series_name(story_path, file_path):
+    """Return the name of the series defined by the story file.
+    """
+    p = path(story_path).expand().abspath()
+    return unicode(path(file_path).expand().abspath().relpath(p).splitext()[0])
+
+
+class MappedSources(object):
+    """Memory-maps story files for streaming parses; unmaps them all on exit.
+    """
+    def __init__(self):
+        self.maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for source in self.maps:
+            source.close()
+        self.maps = []
+
+    def map(self, file_path):
+        """Return a read-only memory map of the file's contents.
+        """
+        with open(file_path, 'rb') as fi:
+            if not os.fstat(fi.fileno()).st_size:
+                return ''  # Empty files can't be mapped.
+            source = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(source)
+        return source
+
+
+def parse_file(parser, state, story_path, file_path, sources=None):
+    """Parse the story file into the parser state.
+
+    If given `MappedSources`, the file is memory-mapped and streamed through
+    the parser instead of being read into memory.
+    """
+    logger.info("Loading {}".format(file_path))
+    name = get_series_name(story_path, file_path)
+    if sources is not None:
+        parser.parse_stream(state, name, sources.map(file_path))
+    else:
+        parser.parse(state, name, path(file_path).text())
+
+
+#: How long to wait for a pool of workers to build every series, in seconds.
+WORKER_TIMEOUT = 600
+
+
+class WorkerError(RuntimeError):
+    """Building a series failed in a worker process.
+
+    Carries the worker's traceback as text, as the original exception may
+    not survive being sent back to the parent.
+    """
+    pass
+
+
+def _compile_dumped_series(args):
+    """Build a series in a worker process, for sending back to the parent.
+
+    Its templates aren't compiled; as when building series one by one, they
+    are compiled when first rendered.
+    """
+    story_path, file_path, stream = args
+    try:
+        return bundles.dump_series(compile_series_from_file(story_path, file_path, stream)), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def compile_plot_from_path(story_path, workers=None, stream=False):
+    """Parse and compile all the series definitions in the given path.
+
+    With more than one worker, the series are parsed and built in a pool of
+    worker processes; the result is the same as parsing them one by one.
+
+    With `stream`, story files are memory-mapped and their content is only
+    decoded when the plot is built (see `StoryParser.parse_stream`).
     """
     parser = StoryParser()
     state = ParserState()
 
     p = path(story_path).expand().abspath()
-    for fp in p.walkfiles('*.md'):
-        logger.info("Loading {}".format(fp))
-        name = unicode(fp.relpath(p).splitext()[0])
-        parser.parse(state, name, fp.text())
-
     CONFIG = p / 'config.ini'
     config = defaults.load_config(CONFIG)
-    plot = state.compile(config)
 
-    return plot
+    if workers is not None and workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            dumped = pool.map_async(_compile_dumped_series, [
+                (p, fp, stream) for fp in p.walkfiles('*.md')
+            ]).get(WORKER_TIMEOUT)
+        finally:
+            pool.terminate()
+            pool.join()
+        for series, error in dumped:
+            if error is not None:
+                raise WorkerError(error)
+            state.plot.add_built_series(bundles.load_series(series))
+        return state.compile(config)
+
+    with MappedSources() as sources:
+        for fp in p.walkfiles('*.md'):
+            parse_file(parser, state, p, fp, sources if stream else None)
+        return state.compile(config)
+
+
+def compile_series_from_file(story_path, file_path, stream=False):
+    """Parse and compile the single series defined by the story file.
+    """
+    parser = StoryParser()
+    state = ParserState()
+
+    with MappedSources() as sources:
+        parse_file(parser, state, story_path, file_path, sources if stream else None)
+        return state.series.build()
+
+
+def reload_series_from_file(plot, story_path, file_path, stream=False):
+    """Return a new plot with the series defined by the story file rebuilt.
+
+    Every other series is shared with the given plot, compiled templates and
+    all. If the file no longer exists, its series is dropped.
+    """
+    by_name = dict(plot.by_name)
+    replaced = by_name.pop(get_series_name(story_path, file_path), None)
+    if path(file_path).isfile():
+        series = compile_series_from_file(story_path, file_path, stream)
+        by_name[series.name] = series
+
+    new_plot = plot.copy(by_name=by_name)
+    new_plot.copy_static_html(plot, [replaced] if replaced is not None else [])
+    return new_plot
+
+
+def load_plot_from_path(story_path, bundle_path=None, workers=None, stream=False):
+    """Load all the series definitions in the given path.
+
+    If a compiled bundle (by default, `plot.bundle` in the story path) is
+    fresh (see `bundle_is_fresh`), the plot is loaded from the bundle instead.
+    Otherwise, see `compile_plot_from_path`.
+    """
+    p = path(story_path).expand().abspath()
+    if bundle_path is None:
+        bundle_path = p / bundles.BUNDLE_NAME
+
+    if bundle_is_fresh(bundle_path, p):
+        try:
+            return bundles.read_bundle(bundle_path)
+        except bundles.BundleError as e:
+            logger.warning("Ignoring bundle {}: {}".format(bundle_path, e))
+
+    return compile_plot_from_path(p, workers, stream)
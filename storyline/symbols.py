@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""storyline.symbols -- compact, plot-wide ids for situations and flags.
+
+A plot's SymbolTable numbers every situation, and gives a bit position to
+every flag name its templates use literally (e.g. `flags.add('lit')` or
+`'lit' in flags`). States can then be stored as small integers and a
+bitset instead of repeated series, situation and flag names.
+
+Any edit that adds or removes a situation or literal flag changes the
+table. The tables made in this process are kept by version (see
+`get_table`), so states packed before, e.g., a reload can still be read.
+"""
+import hashlib
+
+from jinja2 import nodes
+
+from . import templates
+from . import caches
+
+#: The symbol tables made in this process, by version.
+known_tables = caches.LRUCache(64)
+
+
+def get_table(version):
+    """Return the symbol table with the given version, if one was made in this process.
+    """
+    return known_tables.get(version)
+
+
+def find_flags(string):
+    """Return the flag names used literally by the template source.
+    """
+    flags = set()
+    ast = templates.environment.parse(string)
+    for node in ast.find_all(nodes.Call):
+        target = node.node
+        if (isinstance(target, nodes.Getattr)
+                and isinstance(target.node, nodes.Name) and target.node.name == 'flags'):
+            flags.update(
+                arg.value for arg in node.args
+                if isinstance(arg, nodes.Const) and isinstance(arg.value, basestring)
+            )
+    for node in ast.find_all(nodes.Compare):
+        if not (isinstance(node.expr, nodes.Const) and isinstance(node.expr.value, basestring)):
+            continue
+        for operand in node.ops:
+            if (operand.op in ('in', 'notin')
+                    and isinstance(operand.expr, nodes.Name) and operand.expr.name == 'flags'):
+                flags.add(node.expr.value)
+    return flags
+
+
+class SymbolTable(object):
+    """Small integer ids for a plot's situations, and bit positions for its flags.
+
+    Both are numbered in sorted order, so the same plot always gets the
+    same table; `version` identifies it.
+    """
+    def __init__(self, pairs, flags):
+        self.pairs = tuple(sorted(pairs))
+        self.pair_ids = dict((pair, i) for i, pair in enumerate(self.pairs))
+        self.flags = tuple(sorted(flags))
+        self.flag_bits = dict((flag, i) for i, flag in enumerate(self.flags))
+
+        digest = hashlib.sha1()
+        for pair in self.pairs:
+            digest.update(u'{}::{}\n'.format(*pair).encode('utf-8'))
+        digest.update('\n')
+        for flag in self.flags:
+            digest.update(u'{}\n'.format(flag).encode('utf-8'))
+        self.version = digest.hexdigest()[:8]
+        known_tables.set(self.version, self)
+
+    @classmethod
+    def from_plot(cls, plot):
+        """Return the symbol table for every situation and literal flag in the plot.
+        """
+        pairs = [
+            situation.pair
+            for series in plot.by_name.itervalues()
+            for situation in series.ordered
+        ]
+        flags = set()
+        for renderable in plot.iter_renderables():
+            content = renderable.get('content')
+            if content:
+                flags.update(find_flags(content))
+        return cls(pairs, flags)
+
+    def pack_pair(self, pair):
+        """Return the id of the `(series_name, situation_name)` pair.
+
+        Pairs not in the table are returned as they are.
+        """
+        if pair is None:
+            return None
+        try:
+            return self.pair_ids[tuple(pair)]
+        except KeyError:
+            return pair
+
+    def unpack_pair(self, packed):
+        """Return the `(series_name, situation_name)` pair for the output of `pack_pair`.
+
+        Raises IndexError for an id not in the table.
+        """
+        if isinstance(packed, (int, long)):
+            if packed < 0:
+                raise IndexError("No situation with id {}".format(packed))
+            return self.pairs[packed]
+        return packed
+
+    def pack_flags(self, flags):
+        """Return the flags as a bitset, and a sorted list of any not in the table.
+        """
+        bits = bytearray((len(self.flags) + 7) // 8)
+        extra = []
+        for flag in flags:
+            try:
+                i = self.flag_bits[flag]
+            except KeyError:
+                extra.append(flag)
+            else:
+                bits[i >> 3] |= 1 << (i & 7)
+        return str(bits).rstrip('\0'), sorted(extra)
+
+    def unpack_flags(self, bits, extra=()):
+        """Return the set of flags for the output of `pack_flags`.
+
+        Raises IndexError for a bit not in the table.
+        """
+        flags = set(extra)
+        for byte_index, byte in enumerate(bytearray(bits)):
+            for bit in xrange(8):
+                if byte & (1 << bit):
+                    flags.add(self.flags[(byte_index << 3) | bit])
+        return flags
@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
 """storyline.templates
 """
+import os
+import hashlib
+import threading
+
 from jinja2 import Environment
+from jinja2 import meta
+from jinja2 import nodes
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import DictLoader, ModuleLoader, TemplateNotFound
+
+from . import caches
 
 
 environment = Environment(
@@ -12,8 +22,209 @@ environment = Environment(
 )
 
 
+bytecode_cache = None
+
+
+def set_bytecode_cache(directory=None):
+    """Cache compiled template bytecode on disk in the given directory.
+
+    Pass None to turn the cache off.
+    """
+    global bytecode_cache
+    if directory:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        bytecode_cache = FileSystemBytecodeCache(directory)
+    else:
+        bytecode_cache = None
+
+
+def get_source_key(string):
+    """Return the content hash which identifies a template source.
+    """
+    source = string.encode('utf-8') if isinstance(string, unicode) else string
+    return hashlib.sha1(source).hexdigest()
+
+
 def get_template_from_string(string):
-    return environment.from_string(string)
+    if bytecode_cache is None:
+        return environment.from_string(string)
+
+    # Templates made from strings have no name, so key them by their source.
+    bucket = bytecode_cache.get_bucket(environment, get_source_key(string), None, string)
+    if bucket.code is None:
+        bucket.code = compile_template_code(string)
+        bytecode_cache.set_bucket(bucket)
+    return get_template_from_code(bucket.code)
+
+
+def get_referenced_names(string):
+    """Return the names the template source looks up in its context.
+    """
+    return frozenset(meta.find_undeclared_variables(environment.parse(string)))
+
+
+def is_static(string):
+    """Is the template source plain text, with no expressions, statements or comments?
+    """
+    return all(
+        isinstance(node, nodes.Output)
+        and all(isinstance(child, nodes.TemplateData) for child in node.nodes)
+        for node in environment.parse(string).body
+    )
+
+
+def compile_template_code(string):
+    """Compile the template source to a Python code object.
+    """
+    return environment.compile(string)
+
+
+def get_template_from_code(code):
+    """Return a template from a code object made by `compile_template_code`.
+    """
+    return environment.template_class.from_code(
+        environment, code, environment.make_globals(None))
+
+
+module_environment = None
+
+
+def compile_template_modules(sources, target):
+    """Compile the template sources to Python modules in a zip archive.
+
+    Modules are named by source key, for `set_template_modules`.
+    """
+    loader = DictLoader(dict((get_source_key(source), source) for source in sources))
+    environment.overlay(loader=loader).compile_templates(
+        target, zip='deflated', ignore_errors=False, py_compile=True)
+
+
+def set_template_modules(target=None):
+    """Import templates precompiled by `compile_template_modules` from the zip archive.
+
+    Pass None to stop using precompiled modules.
+    """
+    global module_environment
+    if target:
+        module_environment = environment.overlay(loader=ModuleLoader(target), cache_size=0)
+    else:
+        module_environment = None
+
+
+def get_template_from_module(key):
+    """Return the precompiled template for the source key, or None.
+    """
+    if module_environment is None:
+        return None
+    try:
+        return module_environment.get_template(key)
+    except TemplateNotFound:
+        return None
+
+
+class TemplateRegistry(object):
+    """A thread-safe store of compiled templates, keyed by source hash.
+
+    Every renderable with the same source shares one compiled template, and
+    one set of the context names it refers to.
+
+    Each store is bounded, evicting the least recently used sources, so that
+    sources edited away on reload don't pile up. A renderable keeps what it
+    got from the registry, so eviction only costs a recompile if a later
+    renderable has the same source.
+    """
+    missing = object()
+
+    def __init__(self, maxsize=4096):
+        self.templates = caches.LRUCache(maxsize)
+        self.names = caches.LRUCache(maxsize)
+        self.static = caches.LRUCache(maxsize)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self.templates.maxsize
+
+    def resize(self, maxsize):
+        """Bound each store to `maxsize` sources, from the next one added.
+        """
+        with self.lock:
+            for store in (self.templates, self.names, self.static):
+                store.maxsize = maxsize
+
+    def __len__(self):
+        return len(self.templates)
+
+    def __contains__(self, key):
+        return key in self.templates
+
+    def get(self, string):
+        """Return the compiled template for the source, compiling it if need be.
+        """
+        key = get_source_key(string)
+        with self.lock:
+            template = self.templates.get(key)
+            if template is not None:
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        # Compile outside the lock, so that threads can compile in parallel.
+        template = get_template_from_module(key)
+        if template is None:
+            template = get_template_from_string(string)
+        return self.add(key, template)
+
+    def get_names(self, string):
+        """Return the context names the template source refers to.
+        """
+        key = get_source_key(string)
+        names = self.names.get(key)
+        if names is None:
+            names = self.setdefault(self.names, key, get_referenced_names(string))
+        return names
+
+    def get_static_text(self, string):
+        """Return the text of a static template source, or None if it isn't static.
+        """
+        key = get_source_key(string)
+        text = self.static.get(key, self.missing)
+        if text is self.missing:
+            text = self.get(string).render() if is_static(string) else None
+            text = self.setdefault(self.static, key, text)
+        return text
+
+    def add(self, key, template):
+        """Register an already-compiled template for the source key.
+
+        Return the registered template, which is the existing one if the key
+        is already known.
+        """
+        return self.setdefault(self.templates, key, template)
+
+    def setdefault(self, store, key, value):
+        """Return the store's value for the key, first setting it to `value` if there is none.
+        """
+        with self.lock:
+            existing = store.get(key, self.missing)
+            if existing is not self.missing:
+                return existing
+            store.set(key, value)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+            self.names.clear()
+            self.static.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+registry = TemplateRegistry()
 
 
 class Renderable(object):
@@ -21,9 +232,45 @@ class Renderable(object):
     def template(self):
         """Return the Jinja2 template for building the Situation's content.
         """
-        if not hasattr(self, '_template'):
-            self._template = get_template_from_string(self.content)
-        return self._template
+        try:
+            return self._template
+        except AttributeError:
+            self._template = registry.get(self.content)
+            return self._template
 
-    def render(self, context):
-        return self.template.render(**context)
+    @property
+    def names(self):
+        """Return the names the template looks up in its context.
+        """
+        try:
+            return self._names
+        except AttributeError:
+            self._names = registry.get_names(self.content)
+            return self._names
+
+    @property
+    def static_text(self):
+        """Return the rendered text if the template is static (see `is_static`), else None.
+        """
+        try:
+            return self._static_text
+        except AttributeError:
+            content = self.content
+            if isinstance(content, basestring):
+                self._static_text = registry.get_static_text(content)
+            else:
+                self._static_text = None
+            return self._static_text
+
+    def render(self, context, **extra):
+        """Render the template with the context, plus any extra names.
+
+        Only the names the template refers to are looked up in the context,
+        so a lazy context (see `contexts.LazyContext`) only builds those.
+        """
+        if self.static_text is not None:
+            return self.static_text
+        template = self.template
+        names = dict((name, context[name]) for name in self.names if name in context)
+        names.update(extra)
+        return template.render(names)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""storyline.timing -- where a turn spends its time.
+
+Timing is off by default, and then costs nothing: `enable` wraps each
+stage's function in place, and `disable` puts the originals back. Each
+call to a stage is observed in a histogram for the stage, and added to the
+current request's timings, if one was started.
+
+Stages are inclusive: e.g. `trigger` includes the `template` renders it
+causes. A stage called from within itself is only timed once.
+"""
+import time
+import bisect
+import importlib
+import threading
+import collections
+
+#: (module, class or None, function, stage) for each timed stage of a turn.
+STAGES = [
+    ('storyline.serializers', 'MsgPackStateSerializer', 'loads', 'state_loads'),
+    ('storyline.serializers', 'CompactMsgPackStateSerializer', 'loads', 'state_loads'),
+    ('storyline.serializers', 'DeltaMsgPackStateSerializer', 'loads', 'state_loads'),
+    ('storyline.serializers', 'CachingStateSerializer', 'loads', 'state_loads'),
+    ('storyline.states', 'PlotState', '__init__', 'state_init'),
+    ('storyline.states', 'Transition', 'trigger', 'trigger'),
+    ('storyline.states', 'Transition', 'render_situation', 'render_situation'),
+    ('storyline.states', 'Transition', 'as_context', 'as_context'),
+    ('storyline.templates', 'Renderable', 'render', 'template'),
+    ('storyline.presenters', None, 'convert_markdown', 'markdown'),
+    ('storyline.presenters', None, 'typogrify', 'typogrify'),
+    ('storyline.serializers', 'MsgPackStateSerializer', 'dumps', 'state_dumps'),
+    ('storyline.serializers', 'CompactMsgPackStateSerializer', 'dumps', 'state_dumps'),
+    ('storyline.serializers', 'DeltaMsgPackStateSerializer', 'dumps', 'state_dumps'),
+    ('storyline.serializers', 'CachingStateSerializer', 'dumps', 'state_dumps'),
+]
+
+#: Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+enabled = False
+originals = []
+local = threading.local()
+
+
+class Histogram(object):
+    """A thread-safe histogram of durations, with Prometheus-style buckets.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, duration):
+        index = bisect.bisect_left(self.buckets, duration)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += duration
+
+    def cumulative_counts(self):
+        """Return `(upper bound, count)` for each bucket, counting every lower bucket too.
+        """
+        with self.lock:
+            counts = list(self.counts)
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'), ), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics(object):
+    """A histogram of durations for each stage.
+    """
+    name = 'storyline_stage_seconds'
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def observe(self, stage, duration):
+        try:
+            histogram = self.histograms[stage]
+        except KeyError:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram(self.buckets))
+        histogram.observe(duration)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def exposition(self):
+        """Return the histograms in the Prometheus text format.
+        """
+        lines = [
+            '# HELP {} Time spent in each stage of a turn.'.format(self.name),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        with self.lock:
+            histograms = self.histograms.items()
+        for stage, histogram in histograms:
+            for bound, count in histogram.cumulative_counts():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(self.name, stage, le, count))
+            lines.append('{}_sum{{stage="{}"}} {!r}'.format(self.name, stage, histogram.sum))
+            lines.append('{}_count{{stage="{}"}} {}'.format(self.name, stage, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def observe(stage, duration):
+    """Record a duration for the stage, in seconds.
+    """
+    metrics.observe(stage, duration)
+    timings = getattr(local, 'timings', None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + duration
+
+
+def timed(stage, func):
+    """Return the function wrapped to time each call as the stage.
+    """
+    def wrapper(*args, **kwargs):
+        active = local.__dict__.setdefault('active', set())
+        if stage in active:
+            return func(*args, **kwargs)
+        active.add(stage)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe(stage, time.time() - start)
+            active.discard(stage)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def wrap(attribute, stage):
+    """Return a class or module attribute (a function, classmethod or staticmethod), timed.
+    """
+    if isinstance(attribute, (classmethod, staticmethod)):
+        return type(attribute)(timed(stage, attribute.__func__))
+    return timed(stage, attribute)
+
+
+def enable(stages=STAGES):
+    """Start timing each stage.
+    """
+    global enabled
+    if enabled:
+        return
+    for module_name, owner_name, name, stage in stages:
+        module = importlib.import_module(module_name)
+        owner = module if owner_name is None else getattr(module, owner_name)
+        attribute = owner.__dict__[name]
+        originals.append((owner, name, attribute))
+        setattr(owner, name, wrap(attribute, stage))
+    enabled = True
+
+
+def disable():
+    """Stop timing, restoring every stage's original function.
+    """
+    global enabled
+    while originals:
+        owner, name, attribute = originals.pop()
+        setattr(owner, name, attribute)
+    enabled = False
+
+
+def start_request():
+    """Start collecting this thread's timings for a request.
+    """
+    local.timings = collections.OrderedDict()
+    local.start = time.time()
+
+
+def finish_request():
+    """Stop collecting this thread's timings, and return them, by stage.
+
+    The whole request is included as the `request` stage.
+    """
+    timings = getattr(local, 'timings', None)
+    if timings is None:
+        return collections.OrderedDict()
+    local.timings = None
+    duration = time.time() - local.start
+    metrics.observe('request', duration)
+    timings['request'] = duration
+    return timings
+
+
+def server_timing(timings):
+    """Return the timings, by stage, as a Server-Timing header value (in milliseconds).
+    """
+    return ', '.join(
+        '{};dur={:.3f}'.format(stage, duration * 1000)
+        for stage, duration in timings.iteritems()
+    )
@@ -4,17 +4,25 @@
 import logging
 logger = logging.getLogger('turns')
 
-import markdown
-from typogrify.filters import typogrify
-
 from . import states
+from . import presenters
 
 
 class TurnManager(object):
-    def __init__(self, plot, state_dict=None):
+    """Takes turns in a plot.
+
+    With `stream`, the story is presented as an iterator of HTML fragments,
+    converted as they are consumed, rather than as one string. The turn's
+    state is final either way before any of the story is presented.
+    """
+    def __init__(self, plot, state_dict=None, stream=False):
         self.plot = plot
+        self.stream = stream
 
-        if state_dict is not None:
+        if isinstance(state_dict, states.PlotState) and state_dict.plot is plot:
+            # Already validated, e.g. by a state serializer.
+            state = state_dict.clear_messages()
+        elif state_dict is not None:
             state = states.PlotState(plot, state_dict)
             state = state.clear_messages()
         else:
@@ -30,13 +38,15 @@ class TurnManager(object):
         if not self.state.messages:
             self.state = self.state.render_situation()
 
-        story_text = u'\n\n'.join(m for m in self.state.messages
-                                  if m is not None and m.strip())
+        presenter = presenters.HTMLPresenter(
+            self.plot.config['markdown']['extensions'],
+            pinned = self.plot.static_html,
+        )
+        if self.stream:
+            return presenter.iter_present(self.state.messages)
 
-        logger.debug("#### The Story:\n%s", story_text)
-        md_extensions = self.plot.config['markdown']['extensions']
-        story_text = markdown.markdown(story_text, extensions=md_extensions)
-        story = typogrify(story_text)
+        story = presenter.present(self.state.messages)
+        logger.debug("#### The Story:\n%s", story)
 
         return story
 
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.bundles
+"""
+import unittest
+from cStringIO import StringIO
+
+from path import path
+from ensure import ensure
+
+PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+
+
+class BundleTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import storyfile
+        self.sources = storyfile.get_source_stamps(PATH)
+        self.plot = storyfile.compile_plot_from_path(PATH)
+
+    def dump(self, plot):
+        from storyline import bundles
+        fo = StringIO()
+        bundles.dump_plot(plot, fo, self.sources)
+        return fo.getvalue()
+
+    def roundtrip(self, plot):
+        from storyline import bundles
+        return bundles.load_plot(StringIO(self.dump(plot)))
+
+    def test_it_should_record_the_source_stamps(self):
+        from storyline import bundles
+        ensure(self.sources).is_nonempty()
+        ensure(bundles.load_sources(StringIO(self.dump(self.plot)))).equals(self.sources)
+
+    def test_it_should_load_the_plot_it_dumped(self):
+        from storyline import entities
+        plot = self.roundtrip(self.plot)
+        ensure(plot).is_an(entities.Plot)
+        ensure(plot).equals(self.plot)
+        ensure(plot.config).equals(self.plot.config)
+
+    def test_it_should_resolve_addresses_when_loading(self):
+        plot = self.roundtrip(self.plot)
+        ensure(plot.__dict__).contains('_addresses')
+        ensure(plot.addresses).equals(self.plot.addresses)
+
+    def test_it_should_rebuild_entities(self):
+        from storyline import entities
+        plot = self.roundtrip(self.plot)
+        series = plot.by_name['rooms']
+        ensure(series).is_an(entities.Series)
+        ensure(series.by_name['bar']).is_(series.ordered[2])
+        situation = series.by_name['bar']
+        ensure(situation).is_an(entities.Situation)
+        ensure(situation.directives['message']).is_an(entities.Directive)
+
+    def test_it_should_provide_precompiled_templates(self):
+        from mock import patch
+        from storyline import templates
+        templates.registry.clear()
+        plot = self.roundtrip(self.plot)
+        situation = plot.by_name['rooms'].by_name['foyer']
+        ensure(templates.registry).contains(templates.get_source_key(situation.content))
+        with patch.object(templates, 'get_template_from_string') as get_template_from_string:
+            ensure(situation.render({})).equals(
+                self.plot.by_name['rooms'].by_name['foyer'].render({}))
+            ensure(get_template_from_string.call_count).equals(0)
+
+    def test_it_should_reject_a_foreign_file(self):
+        from storyline import bundles
+        fi = StringIO('# = not a bundle\n')
+        ensure(bundles.load_plot).called_with(fi).raises(bundles.BundleError)
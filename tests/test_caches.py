@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.caches
+"""
+import unittest
+
+from ensure import ensure
+
+
+class LRUCacheTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import caches
+        self.cache = caches.LRUCache(2)
+
+    def test_it_should_cache_values(self):
+        self.cache.set('foo', 1)
+        ensure(self.cache.get('foo')).equals(1)
+        ensure(self.cache.get('bar')).is_none()
+        ensure(self.cache.get('bar', 2)).equals(2)
+        ensure(self.cache).contains('foo')
+        ensure(self.cache).has_length(1)
+
+    def test_it_should_evict_the_least_recently_used(self):
+        self.cache.set('foo', 1)
+        self.cache.set('bar', 2)
+        self.cache.get('foo')
+        self.cache.set('baz', 3)
+        ensure(self.cache).contains('foo')
+        ensure(self.cache).does_not_contain('bar')
+        ensure(self.cache).contains('baz')
+
+    def test_it_should_count_hits_misses_and_evictions(self):
+        self.cache.set('foo', 1)
+        self.cache.get('foo')
+        self.cache.get('bar')
+        self.cache.set('bar', 2)
+        self.cache.set('baz', 3)
+        ensure(self.cache.stats()).equals({
+            'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 1, 'evictions': 1,
+        })
+        self.cache.clear()
+        ensure(self.cache.stats()).equals({
+            'size': 0, 'maxsize': 2, 'hits': 0, 'misses': 0, 'evictions': 0,
+        })
@@ -16,6 +16,20 @@ class ContextMixinTests(unittest.TestCase):
         d = ContextDict()
         ensure(d.clear()).equals('')
 
+    def test_it_should_wrap_builtin_methods_once_per_class(self):
+        from storyline import contexts
+
+        class ContextDict(contexts.ContextMixin, dict):
+            def clear(self):
+                return None
+
+        ensure(ContextDict.__dict__).contains('get')
+        ensure(ContextDict().get('foo')).equals('')
+        ensure(ContextDict(foo=0).get('foo')).equals(0)
+        ensure(ContextDict().clear()).is_none()
+        ensure(ContextDict.__dict__).does_not_contain('__getitem__')
+        ensure(ContextDict.__getattribute__).is_(dict.__getattribute__)
+
 
 class ContextStateTests(unittest.TestCase):
     def test_it_should_set_items(self):
@@ -79,3 +93,80 @@ class ContextStateTests(unittest.TestCase):
 
         c = contexts.ContextState(foo='bar')
         ensure(c.decr).called_with('foo').raises(TypeError)
+
+
+class LazyContextTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import contexts
+        from mock import Mock
+        self.build_foo = Mock(return_value=u'FOO')
+
+        class Context(contexts.LazyContext):
+            builders = {
+                'foo': self.build_foo,
+                'bar': lambda ctx: ctx['foo'] + u'BAR',
+            }
+
+        self.context = Context()
+
+    def test_it_should_not_build_values_until_looked_up(self):
+        ensure(self.context).has_length(2)
+        ensure(sorted(self.context)).equals(['bar', 'foo'])
+        ensure(self.context).contains('foo')
+        ensure(self.build_foo.called).is_false()
+        ensure(self.context.built).is_empty()
+
+    def test_it_should_build_values_once(self):
+        ensure(self.context['bar']).equals(u'FOOBAR')
+        ensure(self.context['foo']).equals(u'FOO')
+        ensure(self.context.built).equals({'foo': u'FOO', 'bar': u'FOOBAR'})
+        self.build_foo.assert_called_once_with(self.context)
+
+    def test_it_should_raise_a_key_error_for_unknown_names(self):
+        ensure(self.context.__getitem__).called_with('baz').raises(KeyError)
+
+
+class ContextLocationsTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import contexts
+        from nonobvious import frozendict
+        self.originals = frozendict(foo=frozendict(cake=1), bar=frozendict(cake=2))
+        self.locations = contexts.ContextLocations(self.originals)
+
+    def test_it_should_render_mapping_methods_returning_none_as_empty(self):
+        from storyline import templates
+        template = templates.registry.get(
+            u"[{{ elsewhere.update({'x': {'a': 1}}) }}][{{ elsewhere.get('nope') }}]"
+            u"[{{ elsewhere.pop('nope', None) }}][{{ elsewhere.clear() }}]"
+        )
+        ensure(template.render(elsewhere=self.locations)).equals(u'[][][][]')
+        ensure(self.locations).is_empty()
+
+    def test_it_should_copy_locations_on_first_lookup(self):
+        from storyline import contexts
+        ensure(self.locations.copies).is_empty()
+        foo = self.locations['foo']
+        ensure(foo).is_a(contexts.ContextState)
+        ensure(foo).equals({'cake': 1})
+        ensure(self.locations['foo']).is_(foo)
+        ensure(self.locations.copies.keys()).equals(['foo'])
+
+    def test_it_should_look_like_the_original_locations(self):
+        ensure(self.locations).has_length(2)
+        ensure(self.locations).contains('bar')
+        ensure(self.locations.copies).is_empty()
+        ensure(self.locations).equals(self.originals)
+
+    def test_it_should_report_only_changed_and_deleted_locations(self):
+        self.locations['foo'].set('cake', 3)
+        self.locations['bar']
+        self.locations.location('baz')
+        self.locations.set('qux', {'pie': 1})
+        ensure(self.locations.changes()).equals((
+            {'foo': {'cake': 3}, 'qux': {'pie': 1}},
+            set(),
+        ))
+
+        del self.locations['bar']
+        ensure(self.locations).does_not_contain('bar')
+        ensure(self.locations.changes()[1]).equals(set(['bar']))
@@ -97,6 +97,113 @@ class PlotEntityTests(unittest.TestCase):
             self.plot.by_name['foo'].ordered[0]
         )
 
+    def test_it_should_get_a_situation_by_pair(self):
+        ensure(
+            self.plot.situation_for_pair(("foo", "baz"))
+        ).is_(
+            self.plot.by_name['foo'].by_name['baz']
+        )
+        ensure(self.plot.situation_for_pair).called_with(("foo", "blah")).raises(KeyError)
+
+    def test_it_should_get_the_first_situation_for_an_empty_situation_name(self):
+        first = self.plot.by_name['foo'].ordered[0]
+        ensure(self.plot.get_situation_by_address(u'foo::')).is_(first)
+        ensure(self.plot.get_situation_by_address((u'foo', u''))).is_(first)
+        ensure(self.plot.get_situation_by_address(u'foo::', first)).is_(first)
+
+    def test_it_should_raise_a_key_error_for_unknown_addresses(self):
+        ensure(self.plot.get_situation_by_address).called_with("foo::blah").raises(KeyError)
+        ensure(self.plot.get_situation_by_address).called_with("blah").raises(KeyError)
+
+    def test_it_should_build_its_address_table_once(self):
+        ensure(self.plot.addresses).is_(self.plot.addresses)
+        ensure(self.plot.addresses).equals({
+            'foo': self.plot.by_name['foo'].ordered[0],
+            'foo::': self.plot.by_name['foo'].ordered[0],
+            ('foo', None): self.plot.by_name['foo'].ordered[0],
+            ('foo', ''): self.plot.by_name['foo'].ordered[0],
+            ('foo', 'bar'): self.plot.by_name['foo'].by_name['bar'],
+            ('foo', 'baz'): self.plot.by_name['foo'].by_name['baz'],
+            'foo::bar': self.plot.by_name['foo'].by_name['bar'],
+            'foo::baz': self.plot.by_name['foo'].by_name['baz'],
+        })
+
+    def test_it_should_keep_the_address_table_it_resolves(self):
+        from storyline import entities
+        plot = entities.Plot(self.plot)
+        addresses = plot.resolve_addresses()
+        ensure(addresses).equals(self.plot.addresses)
+        ensure(plot.addresses).is_(addresses)
+
+    def test_it_should_have_a_content_version(self):
+        from storyline import entities
+        ensure(self.plot.version).has_length(12)
+        ensure(entities.Plot(self.plot).version).equals(self.plot.version)
+        series = self.plot.by_name['foo']
+        changed = self.plot.copy(by_name={'foo': series.copy(content=u'Changed')})
+        ensure(changed.version).does_not_equal(self.plot.version)
+
+    def test_it_should_iterate_its_renderables(self):
+        ensure(list(self.plot.iter_renderables())).equals([
+            self.plot.by_name['foo'],
+            self.plot.by_name['foo'].by_name['bar'],
+            self.plot.by_name['foo'].by_name['baz'],
+        ])
+
+    def test_it_should_convert_its_static_messages_to_html(self):
+        from storyline import entities
+        situations = [
+            entities.Situation(
+                name='bar', series='foo', content=u"\nHello, *bar*!\n\n",
+                directives={
+                    'wave': entities.Directive(name='wave', situation='bar', content=u"You wave."),
+                    'look': entities.Directive(name='look', situation='bar', content=u"{{ this }}"),
+                },
+            ),
+        ]
+        plot = entities.Plot(
+            by_name = {
+                'foo': entities.Series(
+                    name = 'foo',
+                    content = 'Not a message.',
+                    ordered = situations,
+                    by_name = dict((s.name, s) for s in situations)
+                )
+            },
+            config = {},
+        )
+        ensure(plot.static_html).is_empty()
+        ensure(plot.by_name['foo'].ordered[0].__dict__).does_not_contain('_static_text')
+        ensure(plot.pin_static_html()).equals({
+            u'Hello, *bar*!': u'<p>Hello, <em>bar</em>!</p>',
+            u'You wave.': u'<p>You&nbsp;wave.</p>',
+        })
+        ensure(plot.static_html).is_(plot.static_html)
+
+
+class PlotWarmTests(unittest.TestCase):
+    def setUp(self):
+        from path import path
+        from storyline import storyfile
+        PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+        self.plot = storyfile.compile_plot_from_path(PATH)
+
+    def test_it_should_compile_every_template(self):
+        self.plot.warm()
+        for renderable in self.plot.iter_renderables():
+            ensure(renderable.__dict__).contains('_template')
+            ensure(renderable.__dict__).contains('_names')
+            ensure(renderable.__dict__).contains('_static_text')
+        ensure(self.plot.__dict__).contains('_static_html')
+
+    def test_it_should_compile_every_template_on_a_thread_pool(self):
+        self.plot.warm(threads=4)
+        for renderable in self.plot.iter_renderables():
+            ensure(renderable.__dict__).contains('_template')
+            ensure(renderable.__dict__).contains('_names')
+            ensure(renderable.__dict__).contains('_static_text')
+        ensure(self.plot.__dict__).contains('_static_html')
+
 
 class SituationEntityTests(unittest.TestCase):
     def setUp(self):
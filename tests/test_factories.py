@@ -31,6 +31,20 @@ class PlotFactoryTests(unittest.TestCase):
         ensure(plot.config['start']).equals('start')
         ensure(plot.config['markdown']['extensions']).equals([])
 
+    def test_it_should_resolve_addresses_when_building(self):
+        series = self.factory.add_series("foo")
+        series.add_situation("bar")
+        plot = self.factory.build()
+        ensure(plot.__dict__).contains('_addresses')
+        ensure(plot.addresses['foo::bar']).is_(plot.by_name['foo'].by_name['bar'])
+
+    def test_add_built_series_should_include_it_in_the_plot(self):
+        from storyline import factories
+        series = factories.SeriesFactory("foo").build()
+        self.factory.add_built_series(series)
+        plot = self.factory.build()
+        ensure(plot.by_name['foo']).is_(series)
+
     def test_add_config_should_merge_config_objects(self):
         self.factory.add_config({'start': 'intro'})
         plot = self.factory.build()
@@ -60,6 +74,15 @@ class SeriesFactoryTests(unittest.TestCase):
         ensure(self.factory.lines).has_length(2)
         ensure(self.factory.lines).equals(["foo bar", "bar foo"])
 
+    def test_add_span_merges_consecutive_lines_of_a_source(self):
+        source = "one  \ntwo\n\xc3\xa9\n# = x\nfour"
+        self.factory.add_span(source, 0, 5)
+        self.factory.add_span(source, 6, 9)
+        self.factory.add_span(source, 10, 12)
+        self.factory.add_span(source, 19, 23)
+        ensure(self.factory.lines).has_length(2)
+        ensure(self.factory.get_content()).equals(u"one\ntwo\n\xe9\nfour")
+
     def test_it_should_build_a_series_entity(self):
         from storyline import entities
         self.factory.add_line("blah boo   ")
@@ -145,6 +168,21 @@ class SituationFactoryTests(unittest.TestCase):
 
         ensure(directive.name).equals('anchor text')
         ensure(directive.content).equals('{{ push("start") }}')
+        ensure(directive.get_command()).equals(('push', 'start'))
+
+    def test_it_should_parse_pop_directives_as_native_commands(self):
+        md_link = self.factory.parse_directive('Continue...', 'pop!')
+
+        ensure(md_link).equals('[Continue...](Continue...)')
+        directive = self.factory.directives['Continue...'].build()
+        ensure(directive.content).equals('{{ pop("") }}')
+        ensure(directive.get_command()).equals(('pop', ))
+
+    def test_it_should_not_make_native_commands_of_unknown_actions(self):
+        self.factory.parse_directive('anchor text', 'dance!tango')
+        directive = self.factory.directives['anchor text'].build()
+        ensure(directive.content).equals('{{ dance("tango") }}')
+        ensure(directive.get_command()).is_none()
 
     def test_it_should_parse_directives_with_event_trigger_as_target(self):
         ensure(self.factory.directives).has_length(0)
@@ -158,6 +196,7 @@ class SituationFactoryTests(unittest.TestCase):
 
         ensure(directive.name).equals('anchor text')
         ensure(directive.lines).equals(['{{ trigger("start the macarena") }}'])
+        ensure(directive.command).equals(('trigger', 'start the macarena'))
 
     def test_it_should_compile_content(self):
         ensure(self.factory.directives).has_length(0)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.http
+"""
+import unittest
+
+from path import path
+from ensure import ensure
+from mock import patch
+
+PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+
+
+class ReloaderTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from storyline import http
+        from storyline import storyfile
+        self.tmp = path(tempfile.mkdtemp())
+        self.story_path = self.tmp / 'cloak'
+        PATH.copytree(self.story_path)
+        self.patchers = [
+            patch.object(http, 'plot', storyfile.compile_plot_from_path(self.story_path)),
+            patch.object(http, 'state_store', http.state_store),
+            patch.object(http, 'state_cache', http.state_cache),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.reloader = http.Reloader(self.story_path)
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmp.rmtree()
+
+    def test_it_should_ignore_swap_lock_backup_and_other_files(self):
+        from watchdog.events import FileModifiedEvent, FileCreatedEvent, DirModifiedEvent
+        from storyline import http
+        plot = http.plot
+        for name in ('.actions.md.swp', '.#actions.md', '#actions.md#', 'actions.md~', 'notes.txt'):
+            source = self.story_path / name
+            source.write_text(u'# = junk\n\nJunk.\n')
+            self.reloader.on_any_event(FileCreatedEvent(source))
+            self.reloader.on_any_event(FileModifiedEvent(source))
+        self.reloader.on_any_event(DirModifiedEvent(self.story_path))
+        ensure(http.plot).is_(plot)
+
+    def test_it_should_reload_only_the_series_of_a_changed_story_file(self):
+        from watchdog.events import FileModifiedEvent
+        from storyline import http
+        plot = http.plot
+        source = self.story_path / 'actions.md'
+        source.write_text(u'# = wait\n\nTime passes.\n')
+        self.reloader.on_any_event(FileModifiedEvent(source))
+        ensure(http.plot).is_not(plot)
+        ensure(http.plot.by_name['actions'].by_name.keys()).equals(['wait'])
+        ensure(http.plot.by_name['rooms']).is_(plot.by_name['rooms'])
+
+    def test_it_should_reload_both_sides_of_a_move(self):
+        from watchdog.events import FileMovedEvent
+        from storyline import http
+        source = self.story_path / 'actions.md'
+        dest = self.story_path / 'moves.md'
+        source.rename(dest)
+        self.reloader.on_any_event(FileMovedEvent(source, dest))
+        ensure(http.plot.by_name).does_not_contain('actions')
+        ensure(http.plot.by_name).contains('moves')
+
+    def test_it_should_reload_a_story_file_saved_over_a_temporary_file(self):
+        from watchdog.events import FileMovedEvent
+        from storyline import http
+        temporary = self.story_path / '.actions.md.tmp'
+        temporary.write_text(u'# = wait\n\nTime passes.\n')
+        source = self.story_path / 'actions.md'
+        temporary.rename(source)
+        self.reloader.on_any_event(FileMovedEvent(temporary, source))
+        ensure(http.plot.by_name['actions'].by_name.keys()).equals(['wait'])
+
+    def test_it_should_reload_the_whole_plot_when_the_config_changes(self):
+        from watchdog.events import FileModifiedEvent
+        from storyline import http
+        from storyline import storyfile
+        config = self.story_path / 'config.ini'
+        config.write_text(u'start = rooms::bar\n')
+        with patch.object(storyfile, 'load_plot_from_path', wraps=storyfile.load_plot_from_path) as load:
+            self.reloader.on_any_event(FileModifiedEvent(config))
+        load.assert_called_once_with(self.story_path, None, None, False)
+        ensure(http.plot.config['start']).equals('rooms::bar')
+
+    def test_it_should_rebuild_the_state_store_when_the_config_changes(self):
+        from watchdog.events import FileModifiedEvent
+        from storyline import http
+        from storyline import stores
+        config = self.story_path / 'config.ini'
+        config.write_text(u'[state]\nstore = sqlite\n')
+        self.reloader.on_any_event(FileModifiedEvent(config))
+        ensure(http.state_store).is_a(stores.SQLiteStateStore)
+        ensure(http.state_store.path).equals(self.story_path / 'states.sqlite')
+
+    def test_it_should_resize_the_template_registry_when_the_config_changes(self):
+        from watchdog.events import FileModifiedEvent
+        from storyline import templates
+        config = self.story_path / 'config.ini'
+        config.write_text(u'[templates]\nregistry_size = 8\n')
+        with patch.object(templates, 'registry', templates.TemplateRegistry()):
+            self.reloader.on_any_event(FileModifiedEvent(config))
+            ensure(templates.registry.maxsize).equals(8)
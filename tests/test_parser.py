@@ -32,6 +32,17 @@ class StoryParserTests(unittest.TestCase):
         self.parser.parse_line(state, "Hello world.")
         state.add_line.assert_called_with('Hello world.')
 
+    def test_it_should_tokenize_lines_into_events(self):
+        storydef = "# = intro\nHello.\n# % hush\n## % hush\n## > on_enter\n#=nope\n"
+        ensure(list(self.parser.tokenize(storydef))).equals([
+            ('new_section', '# = intro'),
+            ('line', 'Hello.'),
+            ('comment', '# % hush'),
+            ('comment', '## % hush'),
+            ('directive', '## > on_enter'),
+            ('line', '#=nope'),
+        ])
+
     def test_parse_should_parse_and_add_the_series(self):
         state = Mock()
         storydef = textwrap.dedent("""\
@@ -51,3 +62,21 @@ class StoryParserTests(unittest.TestCase):
         ensure(state.add_situation.call_count).equals(1)
         ensure(state.add_directive.call_count).equals(1)
         ensure(state.add_line.call_count).equals(9)
+
+    def test_it_should_tokenize_a_byte_buffer_into_line_ranges(self):
+        source = "# = intro\r\nHello.\n\n## > on_enter"
+        ensure(list(self.parser.tokenize_stream(source))).equals([
+            ('new_section', 0, 10),
+            ('line', 11, 17),
+            ('line', 18, 18),
+            ('directive', 19, 32),
+        ])
+
+    def test_parse_stream_should_add_lines_as_spans(self):
+        state = Mock()
+        source = "\xef\xbb\xbf# = intro\nHello.\n# % hush\n## > on_enter\n"
+        self.parser.parse_stream(state, 'foo', source)
+        state.add_series.assert_called_with('foo')
+        state.add_situation.assert_called_with(u'intro')
+        state.add_directive.assert_called_with(u'on_enter')
+        state.add_span.assert_called_once_with(source, 13, 19)
@@ -68,3 +68,7 @@ class ParserStateTests(unittest.TestCase):
         from storyline import entities
         plot = self.state.compile()
         ensure(plot).is_an(entities.Plot)
+
+    def test_it_should_compile_the_plot_with_config(self):
+        plot = self.state.compile({'start': 'intro'})
+        ensure(plot.config['start']).equals('intro')
@@ -3,6 +3,8 @@
 """
 import unittest
 
+from mock import patch
+
 from ensure import ensure
 
 from nonobvious import frozenlist, frozenset, frozendict
@@ -17,6 +19,14 @@ class PlotStateTests(unittest.TestCase):
                 directives={
                     'on_enter': entities.Directive(name='on_exit', situation='bar', content="Enter bar!"),
                     'on_exit': entities.Directive(name='on_exit', situation='bar', content="Exit bar!"),
+                    'go baz': entities.Directive(
+                        # Rendering this would raise an UndefinedError.
+                        name='go baz', situation='bar', content='{{ never_rendered() }}',
+                        command=('push', 'baz'),
+                    ),
+                    'go baz slowly': entities.Directive(
+                        name='go baz slowly', situation='bar', content='{{ push("baz") }}',
+                    ),
                 }
             ),
             entities.Situation(
@@ -71,9 +81,10 @@ class PlotStateTests(unittest.TestCase):
         )
 
     def test_plot_state_can_be_instantiated(self):
+        from storyline import states
         ensure(self.state.stack).is_a(frozenlist)
         ensure(self.state.situation).is_a(tuple)
-        ensure(self.state.messages).is_a(frozenlist)
+        ensure(self.state.messages).is_a(states.MessageBuffer)
         ensure(self.state.flags).is_a(frozenset)
         ensure(self.state.this).is_a(frozendict)
         ensure(self.state.locations).is_a(frozendict)
@@ -87,6 +98,28 @@ class PlotStateTests(unittest.TestCase):
         a_copy = self.state.copy()
         ensure(a_copy.plot).is_(self.state.plot)
 
+    def test_it_should_evolve_without_validation(self):
+        from storyline import states
+        with patch.object(states.PlotState, '__init__') as init:
+            a_copy = self.state._evolve(situation=None)
+        ensure(init.called).is_false()
+        ensure(a_copy).is_a(states.PlotState)
+        ensure(a_copy.plot).is_(self.state.plot)
+        ensure(a_copy).equals(self.state.copy(situation=None))
+        ensure(self.state.situation).equals(('foo', 'bar'))
+
+    def test_its_transitions_should_keep_validated_types(self):
+        from storyline import states
+        for new_state in (self.state.push('foo::baz'), self.state.push('foo::baz').pop(),
+                          self.state.replace('foo::baz'), self.state.reset()):
+            ensure(new_state).equals(states.PlotState(self.plot, new_state))
+            ensure(new_state.stack).is_a(frozenlist)
+            ensure(new_state.situation).is_a(tuple)
+            ensure(new_state.messages).is_a(states.MessageBuffer)
+            ensure(new_state.flags).is_a(frozenset)
+            ensure(new_state.this).is_a(frozendict)
+            ensure(new_state.locations).is_a(frozendict)
+
     def test_it_should_create_a_context(self):
         from storyline import contexts
         ctx = self.state.as_context()
@@ -110,9 +143,63 @@ class PlotStateTests(unittest.TestCase):
         ensure(ctx['commands']).is_empty()
 
         ftype = type(lambda: None)
-        for command in 'push pop replace select reset'.split():
+        for command in 'push pop replace select reset trigger'.split():
             ensure(ctx[command]).is_a(ftype)
 
+    def test_it_should_build_its_context_lazily(self):
+        ctx = self.state.as_context()
+        ensure(ctx.built).is_empty()
+        ctx['here'].set('cake', 2)
+        ensure(sorted(ctx.built)).equals(['elsewhere', 'here'])
+
+    def test_it_should_only_take_up_context_values_that_were_looked_up(self):
+        ctx = self.state.as_context()
+        ctx['push']('foo::baz')
+        transition = self.state.transition().from_context(ctx)
+        ensure(transition.this).is_(self.state.this)
+        ensure(transition.flags).is_(self.state.flags)
+        ensure(transition.stack).equals([('foo', 'bar'), ('foo', 'baz')])
+
+    def test_it_should_keep_changes_made_here(self):
+        ctx = self.state.as_context()
+        ctx['here'].incr('cake')
+        new_state = self.state.from_context(ctx)
+        ensure(new_state.locations['foo::bar']['cake']).equals(2)
+        ensure(new_state.locations['foo::bar']).is_a(frozendict)
+        ensure(self.state.locations['foo::bar']['cake']).equals(1)
+
+    def test_it_should_start_a_location_here_only_when_changed(self):
+        state = self.state.copy(locations={})
+        ctx = state.as_context()
+        ensure(ctx['here']).does_not_contain('cake')
+        ensure(state.from_context(ctx).locations).is_empty()
+
+        ctx['here'].set('cake', 1)
+        ensure(state.from_context(ctx).locations).equals({'foo::bar': {'cake': 1}})
+
+    def test_it_should_only_rebuild_changed_locations(self):
+        state = self.state.copy(locations={
+            'foo::bar': {'cake': 1},
+            'foo::baz': {'cake': 2},
+            'foo::start': {'cake': 3},
+        })
+        ctx = state.as_context()
+        ctx['elsewhere']['foo::baz'].set('cake', 5)
+        ctx['elsewhere']['foo::start'].is_('cake')
+        del ctx['elsewhere']['foo::bar']
+        new_state = state.from_context(ctx)
+        ensure(new_state.locations).equals({
+            'foo::baz': {'cake': 5},
+            'foo::start': {'cake': 3},
+        })
+        ensure(new_state.locations['foo::start']).is_(state.locations['foo::start'])
+
+    def test_it_should_validate_changed_locations(self):
+        from nonobvious.entities import ValidationError
+        ctx = self.state.as_context()
+        ctx['here'].set('cake', ['a', 'lie'])
+        ensure(self.state.from_context).called_with(ctx).raises(ValidationError)
+
     def test_its_context_should_have_push_command(self):
         ctx = self.state.as_context()
         ctx['push']('foo')
@@ -190,6 +277,60 @@ class PlotStateTests(unittest.TestCase):
         new_state = self.state.trigger('on_enter')
         ensure(new_state.messages).contains('Enter bar!')
 
+    def test_it_should_trigger_a_native_command_without_rendering(self):
+        new_state = self.state.trigger('go baz')
+        ensure(new_state).equals(self.state.trigger('go baz slowly'))
+        ensure(new_state.stack).equals([('foo', 'bar'), ('foo', 'baz')])
+
+    def test_it_should_not_render_a_static_directive(self):
+        from storyline import entities
+        from storyline import states
+        with patch.object(entities.Directive, 'render') as render:
+            with patch.object(states.Transition, 'as_context') as as_context:
+                new_state = self.state.trigger('on_enter')
+        ensure(new_state.messages).contains('Enter bar!')
+        ensure(render.called).is_false()
+        ensure(as_context.called).is_false()
+
+    def test_it_should_not_render_a_static_situation(self):
+        from storyline import entities
+        from storyline import states
+        with patch.object(entities.Situation, 'render') as render:
+            with patch.object(states.Transition, 'as_context') as as_context:
+                new_state = self.state.render_situation()
+        ensure(new_state.messages).equals(['Hello, bar!'])
+        ensure(render.called).is_false()
+        ensure(as_context.called).is_false()
+
+    def test_it_should_pin_static_messages_as_they_are_shown(self):
+        ensure(self.plot.static_html).is_empty()
+        self.state.render_situation().trigger('on_enter')
+        ensure(self.plot.static_html).equals({'Hello, bar!': None, 'Enter bar!': None})
+
+    def test_it_should_run_commands(self):
+        new_state = self.state.run_command(('select', 'foo::baz'))
+        ensure(new_state.stack).equals([('foo', 'baz')])
+        ensure(self.state.run_command).called_with(('explode', 'foo')).raises(ValueError)
+
+    def test_it_should_apply_several_commands_in_one_transition(self):
+        transition = self.state.transition()
+        transition.run_command(('push', 'foo::baz'))
+        transition.run_command(('pop', ))
+        transition.run_command(('replace', 'foo::start'))
+        ensure(self.state.stack).equals([('foo', 'bar')])
+
+        new_state = transition.freeze()
+        ensure(new_state).equals(
+            self.state.push('foo::baz').pop().replace('foo::start')
+        )
+        ensure(new_state.plot).is_(self.plot)
+
+    def test_it_should_validate_a_context_in_a_transition(self):
+        from nonobvious.entities import ValidationError
+        ctx = self.state.as_context()
+        ctx['this']['spam'] = ['not', 'a', 'simple', 'value']
+        ensure(self.state.from_context).called_with(ctx).raises(ValidationError)
+
     def test_it_should_exit_the_current_situation_and_set_to_None(self):
         new_state = self.state._exit()
         ensure(new_state.situation).is_none()
@@ -241,3 +382,37 @@ class PlotStateTests(unittest.TestCase):
         ensure(new_state.flags).is_empty()
         ensure(new_state.this).is_empty()
         ensure(new_state.locations).is_empty()
+
+
+class MessageBufferTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import states
+        self.buffer = states.MessageBuffer(['foo', 'bar'])
+
+    def test_it_should_append_without_changing_itself(self):
+        new_buffer = self.buffer.append('baz')
+        ensure(new_buffer).equals(['foo', 'bar', 'baz'])
+        ensure(self.buffer).equals(['foo', 'bar'])
+        ensure(new_buffer).has_length(3)
+        ensure(self.buffer).has_length(2)
+
+    def test_it_should_share_its_messages_with_appended_buffers(self):
+        new_buffer = self.buffer.append('baz')
+        ensure(new_buffer._node[1]).is_(self.buffer._node)
+
+    def test_it_should_be_indexed_like_a_list(self):
+        new_buffer = self.buffer.append('baz')
+        ensure(new_buffer[0]).equals('foo')
+        ensure(new_buffer[-1]).equals('baz')
+        ensure(new_buffer[-3]).equals('foo')
+        ensure(new_buffer[1:]).equals(['bar', 'baz'])
+        ensure(new_buffer.__getitem__).called_with(-4).raises(IndexError)
+        ensure(list(reversed(new_buffer))).equals(['baz', 'bar', 'foo'])
+
+    def test_it_should_compare_with_sequences(self):
+        from storyline import states
+        ensure(self.buffer).equals(states.MessageBuffer(['foo', 'bar']))
+        ensure(self.buffer).equals(('foo', 'bar'))
+        ensure(self.buffer).does_not_equal(['foo'])
+        ensure(self.buffer).does_not_equal('foobar')
+        ensure(states.MessageBuffer()).is_empty()
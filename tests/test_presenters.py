@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.presenters
+"""
+import unittest
+
+from mock import patch
+from ensure import ensure
+
+
+class HTMLPresenterTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import presenters
+        from storyline import caches
+        self.cache = caches.LRUCache(10)
+        self.presenter = presenters.HTMLPresenter(cache=self.cache)
+
+    def test_it_should_render_a_message(self):
+        ensure(self.presenter.render(u"Don't *just* stand there!")).equals(
+            u'<p>Don&#8217;t <em>just</em> stand&nbsp;there!</p>')
+
+    def test_it_should_present_messages_one_by_one(self):
+        ensure(self.presenter.present([u'Hello, bar!', u'', None, u'# Baz'])).equals(
+            u'<p>Hello,&nbsp;bar!</p>\n<h1>Baz</h1>')
+
+    def test_it_should_yield_messages_as_they_are_converted(self):
+        from storyline import presenters
+        fragments = self.presenter.iter_present([u'Hello, bar!', u'', u'# Baz'])
+        with patch.object(presenters, 'to_html', return_value=u'<p>Hello</p>') as to_html:
+            ensure(next(fragments)).equals(u'<p>Hello</p>')
+        ensure(to_html.call_count).equals(1)
+        ensure(list(fragments)).equals([u'\n<h1>Baz</h1>'])
+
+    def test_it_should_cache_the_html_for_each_message(self):
+        from storyline import presenters
+        self.presenter.present([u'Hello, bar!', u'Hello, baz!'])
+        with patch.object(presenters, 'to_html') as to_html:
+            ensure(self.presenter.present([u'Hello, baz!', u'Hello, bar!'])).equals(
+                u'<p>Hello,&nbsp;baz!</p>\n<p>Hello,&nbsp;bar!</p>')
+        ensure(to_html.called).is_false()
+        ensure(self.cache.hits).equals(2)
+
+    def test_it_should_cache_by_markdown_extensions(self):
+        from storyline import presenters
+        self.presenter.render(u'Hello\n{: .greeting }')
+        other = presenters.HTMLPresenter(['attr_list'], cache=self.cache)
+        ensure(other.render(u'Hello\n{: .greeting }')).equals(u'<p class="greeting">Hello</p>')
+        ensure(self.cache).has_length(2)
+
+    def test_it_should_present_pinned_html_without_converting(self):
+        from storyline import presenters
+        presenter = presenters.HTMLPresenter(cache=self.cache, pinned={u'Hello, bar!': u'<p>Pinned</p>'})
+        with patch.object(presenters, 'to_html') as to_html:
+            ensure(presenter.render(u'Hello, bar!')).equals(u'<p>Pinned</p>')
+        ensure(to_html.called).is_false()
+        ensure(self.cache).is_empty()
+
+    def test_it_should_pin_the_html_of_a_message_pinned_without_html(self):
+        from storyline import presenters
+        pinned = {u'Hello, bar!': None}
+        presenter = presenters.HTMLPresenter(cache=self.cache, pinned=pinned)
+        ensure(presenter.present([u'Hello, bar!', u'Hello, baz!'])).equals(
+            u'<p>Hello,&nbsp;bar!</p>\n<p>Hello,&nbsp;baz!</p>')
+        ensure(pinned).equals({u'Hello, bar!': u'<p>Hello,&nbsp;bar!</p>'})
+
+
+class MarkdownConverterTests(unittest.TestCase):
+    def test_it_should_reuse_one_converter_per_thread_and_extensions(self):
+        import threading
+        from storyline import presenters
+        converter = presenters.get_markdown(['attr_list'])
+        ensure(presenters.get_markdown(('attr_list', ))).is_(converter)
+        ensure(presenters.get_markdown()).is_not(converter)
+
+        others = []
+        thread = threading.Thread(target=lambda: others.append(presenters.get_markdown(['attr_list'])))
+        thread.start()
+        thread.join()
+        ensure(others[0]).is_not(converter)
+
+    def test_it_should_reset_the_converter_between_messages(self):
+        from storyline import presenters
+        ensure(presenters.to_html(u'Foo[^1]\n\n[^1]: A note.', ['footnotes'])).contains(u'footnote')
+        ensure(presenters.to_html(u'Bar', ['footnotes'])).equals(u'<p>Bar</p>')
@@ -3,7 +3,7 @@
 """
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 from ensure import ensure
 
 
@@ -92,3 +92,177 @@ class MsgPackStateSerializerTests(unittest.TestCase):
         packed = sz.dumps(self.state)
         new_state = sz.loads(self.plot, packed)
         ensure(new_state).equals(self.state)
+
+    def test_it_should_refuse_state_written_by_another_serializer(self):
+        from storyline import serializers
+        for name, sz in serializers.state_serializers.iteritems():
+            for other_name, other in serializers.state_serializers.iteritems():
+                if other_name != name:
+                    ensure(sz.loads).called_with(self.plot, other.dumps(self.state)).raises(
+                        serializers.StateError)
+
+    def test_it_should_refuse_state_that_does_not_validate(self):
+        import msgpack
+        from storyline import serializers
+        sz = serializers.MsgPackStateSerializer
+        for data in ('garbage', ['a', 'list'], dict(self.state_dict, stack='nope')):
+            ensure(sz.loads).called_with(self.plot, msgpack.packb(data)).raises(serializers.StateError)
+
+
+class CompactMsgPackStateSerializerTests(MsgPackStateSerializerTests):
+    def test_it_should_dump_state(self):
+        from storyline import serializers
+        packed = serializers.CompactMsgPackStateSerializer.dumps(self.state)
+        ensure(len(packed)).is_less_than(len(serializers.MsgPackStateSerializer.dumps(self.state)))
+
+    def test_it_should_load_state(self):
+        from storyline import serializers
+        sz = serializers.CompactMsgPackStateSerializer
+        for state in (self.state, self.state.copy(stack=[('foo', 'bar'), ('elsewhere', 'qux')])):
+            ensure(sz.loads(self.plot, sz.dumps(state))).equals(state)
+
+    def test_it_should_refuse_state_for_an_unknown_version_of_the_plot(self):
+        from storyline import serializers
+        from storyline import symbols
+        sz = serializers.CompactMsgPackStateSerializer
+        packed = sz.dumps(self.state)
+        self.plot._symbols = symbols.SymbolTable([('foo', 'bar')], [])
+        symbols.known_tables.clear()
+        ensure(sz.loads).called_with(self.plot, packed).raises(serializers.StateError)
+        ensure(sz.loads).called_with(self.plot, 'garbage').raises(serializers.StateError)
+
+    def test_it_should_refuse_ids_and_flags_not_in_the_table(self):
+        import msgpack
+        from storyline import serializers
+        sz = serializers.CompactMsgPackStateSerializer
+        version = self.plot.symbols.version
+        for stack, flags in (([99], ''), ([-1], ''), ([0], '\xff' * 8), (['nope'], '')):
+            packed = msgpack.packb([version, stack, 0, flags, [], {}, {}, []])
+            ensure(sz.loads).called_with(self.plot, packed).raises(serializers.StateError)
+
+    def test_it_should_load_state_for_an_earlier_version_of_the_plot(self):
+        from storyline import serializers
+        from storyline import symbols
+        sz = serializers.CompactMsgPackStateSerializer
+        packed = sz.dumps(self.state)
+        table = self.plot.symbols
+        self.plot._symbols = symbols.SymbolTable(table.pairs + (('foo', 'new'), ), table.flags + ('new', ))
+        ensure(sz.loads(self.plot, packed)).equals(self.state)
+
+    def test_it_should_refuse_state_in_a_situation_no_longer_in_the_plot(self):
+        from storyline import serializers
+        from storyline import symbols
+        sz = serializers.CompactMsgPackStateSerializer
+        old_table = symbols.SymbolTable(self.plot.symbols.pairs + (('foo', 'gone'), ), [])
+        self.plot._symbols = old_table
+        packed = sz.dumps(self.state.copy(stack=[('foo', 'gone')]))
+        del self.plot._symbols
+        ensure(sz.loads).called_with(self.plot, packed).raises(serializers.StateError)
+
+    def test_it_should_be_chosen_by_the_plot_config(self):
+        from storyline import serializers
+        from storyline import defaults
+        ensure(serializers.get_state_serializer(defaults.load_config())).is_(
+            serializers.MsgPackStateSerializer)
+        ensure(serializers.get_state_serializer(defaults.load_config({'state': {'serializer': 'compact'}}))).is_(
+            serializers.CompactMsgPackStateSerializer)
+
+
+class DeltaMsgPackStateSerializerTests(MsgPackStateSerializerTests):
+    def test_it_should_work_out_the_baseline_once_per_plot(self):
+        from storyline import serializers
+        sz = serializers.DeltaMsgPackStateSerializer
+        baseline = sz.get_baseline(self.plot)
+        with patch.object(serializers.MsgPackStateSerializer, 'dumps') as dumps:
+            ensure(sz.get_baseline(self.plot)).is_(baseline)
+        ensure(dumps.called).is_false()
+
+    def test_it_should_dump_state(self):
+        from storyline import serializers, states
+        sz = serializers.DeltaMsgPackStateSerializer
+        state = states.get_start_state(self.plot).push('foo::bar').clear_messages()
+        state = state.copy(this={'exp': 1})
+        packed = sz.dumps(state)
+        ensure(len(packed)).is_less_than(len(serializers.MsgPackStateSerializer.dumps(state)))
+
+        import msgpack
+        key, delta = msgpack.unpackb(packed)
+        ensure(key).equals(sz.get_baseline(self.plot)[1])
+        ensure(delta['this']).equals([{'exp': 1}, []])
+        ensure(delta).does_not_contain('locations')
+
+    def test_it_should_load_state(self):
+        from storyline import serializers, states
+        sz = serializers.DeltaMsgPackStateSerializer
+        start = states.get_start_state(self.plot)
+        for state in (
+            start,
+            start.push('foo::bar').clear_messages(),
+            start.copy(this={'exp': 2}, flags=['lit'], locations={'foo::baz': {'cake': 1}}),
+            self.state,
+        ):
+            ensure(sz.loads(self.plot, sz.dumps(state))).equals(state)
+
+    def test_it_should_fall_back_to_the_whole_state(self):
+        from storyline import serializers
+        sz = serializers.DeltaMsgPackStateSerializer
+        state = self.state.copy(stack=[('foo', 'bar')] * 3, locations={})
+        with patch.object(sz, 'get_baseline', return_value=(self.state, 'abcdef12')):
+            packed = sz.dumps(state.copy(this={}, flags=[]))
+        import msgpack
+        ensure(msgpack.unpackb(packed)[0]).equals('')
+        ensure(sz.loads(self.plot, packed)).equals(state.copy(this={}, flags=[]))
+
+    def test_it_should_refuse_a_delta_against_another_baseline(self):
+        from storyline import serializers, states
+        sz = serializers.DeltaMsgPackStateSerializer
+        packed = sz.dumps(states.get_start_state(self.plot).copy(this={'exp': 2}))
+        with patch.object(sz, 'get_baseline', return_value=(self.state, 'abcdef12')):
+            ensure(sz.loads).called_with(self.plot, packed).raises(serializers.StateError)
+
+    def test_it_should_refuse_a_delta_of_the_wrong_shape(self):
+        import msgpack
+        from storyline import serializers
+        sz = serializers.DeltaMsgPackStateSerializer
+        key = sz.get_baseline(self.plot)[1]
+        for data in (['', 'garbage'], [key, 'garbage'], [key, {'this': 5}],
+                     [key, {'flags': [1]}], [key, {'stack': 'nope'}]):
+            ensure(sz.loads).called_with(self.plot, msgpack.packb(data)).raises(serializers.StateError)
+
+
+class CachingStateSerializerTests(MsgPackStateSerializerTests):
+    def setUp(self):
+        super(CachingStateSerializerTests, self).setUp()
+        from storyline import serializers
+        from storyline import caches
+        self.cache = caches.LRUCache(10)
+        self.sz = serializers.CachingStateSerializer(serializers.MsgPackStateSerializer, self.cache)
+
+    def test_it_should_dump_state(self):
+        from storyline import serializers
+        packed = self.sz.dumps(self.state)
+        ensure(packed).equals(serializers.MsgPackStateSerializer.dumps(self.state))
+        ensure(self.cache).has_length(1)
+
+    def test_it_should_load_state(self):
+        packed = self.sz.dumps(self.state)
+        ensure(self.sz.loads(self.plot, packed)).is_(self.state)
+        ensure(self.cache.hits).equals(1)
+
+    def test_it_should_load_and_cache_unknown_state(self):
+        from storyline import serializers
+        packed = serializers.MsgPackStateSerializer.dumps(self.state)
+        new_state = self.sz.loads(self.plot, packed)
+        ensure(new_state).equals(self.state)
+        ensure(self.sz.loads(self.plot, packed)).is_(new_state)
+        ensure(self.cache.misses).equals(1)
+        ensure(self.cache.hits).equals(1)
+
+    def test_it_should_not_share_states_between_plots(self):
+        from storyline import entities
+        packed = self.sz.dumps(self.state)
+        other_plot = entities.Plot(self.plot)
+        ensure(other_plot.version).equals(self.plot.version)
+        new_state = self.sz.loads(other_plot, packed)
+        ensure(new_state).equals(self.state)
+        ensure(new_state.plot).is_(other_plot)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.stores
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from ensure import ensure
+from mock import Mock, patch
+
+
+class StateStoreTests(unittest.TestCase):
+    def test_it_should_raise_not_implemented(self):
+        from storyline import stores
+        store = stores.StateStore()
+        ensure(store.load).called_with({}).raises(NotImplementedError)
+        ensure(store.save).called_with({}, 'state').raises(NotImplementedError)
+        ensure(store.delete).called_with({}).raises(NotImplementedError)
+
+
+class CookieStateStoreTests(unittest.TestCase):
+    def test_it_should_keep_state_in_the_session(self):
+        from storyline import stores
+        store = stores.CookieStateStore()
+        session = {}
+        ensure(store.load(session)).is_none()
+        store.save(session, 'state')
+        ensure(session).equals({'state': 'state'})
+        ensure(store.load(session)).equals('state')
+        store.delete(session)
+        ensure(session).is_empty()
+
+
+class SQLiteStateStoreTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import stores
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'states.sqlite')
+        self.store = stores.SQLiteStateStore(self.path, batch_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, session):
+        from storyline import stores
+        return stores.SQLiteStateStore(self.path).load(session)
+
+    def test_it_should_keep_only_an_id_in_the_session(self):
+        session = {}
+        self.store.save(session, '\x00state')
+        ensure(session.keys()).equals(['state_id'])
+        ensure(self.store.load(session)).equals('\x00state')
+        ensure(self.store.load({})).is_none()
+
+    def test_it_should_write_states_in_batches(self):
+        first, second = {}, {}
+        self.store.save(first, 'first')
+        ensure(self.read(first)).is_none()
+
+        self.store.write = Mock(wraps=self.store.write)
+        self.store.save(second, 'second')
+        ensure(self.store.write.call_count).equals(1)
+        ensure(self.store.pending).is_empty()
+        ensure(self.read(first)).equals('first')
+        ensure(self.read(second)).equals('second')
+
+    def test_it_should_flush_queued_states(self):
+        session = {}
+        self.store.save(session, 'state')
+        self.store.flush()
+        ensure(self.read(session)).equals('state')
+
+    def test_it_should_delete_states(self):
+        session = {}
+        self.store.save(session, 'state')
+        self.store.flush()
+        self.store.delete(session)
+        ensure(session).is_empty()
+        ensure(self.read({'state_id': 'nope'})).is_none()
+
+    def test_it_should_expire_old_states(self):
+        from storyline import stores
+        store = stores.SQLiteStateStore(self.path, max_age=60)
+        old, new = {}, {}
+        with patch.object(stores.time, 'time', return_value=1000.0):
+            store.save(old, 'old')
+        with patch.object(stores.time, 'time', return_value=1030.0):
+            store.save(new, 'new')
+        with patch.object(stores.time, 'time', return_value=1070.0):
+            ensure(store.load(old)).is_none()
+            ensure(store.load(new)).equals('new')
+            store.prune()
+        ids = [row[0] for row in store.connection.execute("SELECT id FROM states")]
+        ensure(ids).equals([new['state_id']])
+
+    def test_it_should_prune_expired_states_when_writing_now_and_then(self):
+        from storyline import stores
+        store = stores.SQLiteStateStore(self.path, max_age=60)
+        store.prune = Mock(wraps=store.prune)
+        store.save({}, 'first')
+        store.save({}, 'second')
+        ensure(store.prune.call_count).equals(1)
+
+    def test_it_should_add_expiry_to_an_existing_database(self):
+        import sqlite3
+        from storyline import stores
+        path = os.path.join(self.tmp, 'old.sqlite')
+        connection = sqlite3.connect(path)
+        with connection:
+            connection.execute("CREATE TABLE states (id TEXT PRIMARY KEY, state BLOB NOT NULL)")
+            connection.execute("INSERT INTO states VALUES ('old', 'state')")
+        connection.close()
+        ensure(stores.SQLiteStateStore(path).load({'state_id': 'old'})).equals('state')
+        ensure(stores.SQLiteStateStore(path, max_age=60).load({'state_id': 'old'})).is_none()
+
+    def test_it_should_use_write_ahead_logging(self):
+        mode = self.store.connection.execute("PRAGMA journal_mode").fetchone()[0]
+        ensure(mode).equals('wal')
+
+
+class GetStateStoreTests(unittest.TestCase):
+    def test_it_should_be_chosen_by_the_plot_config(self):
+        from storyline import stores
+        from storyline import defaults
+        ensure(stores.get_state_store(defaults.load_config())).is_a(stores.CookieStateStore)
+
+        tmp = tempfile.mkdtemp()
+        try:
+            store = stores.get_state_store(
+                defaults.load_config({'state': {'store': 'sqlite', 'batch_size': '5'}}), tmp)
+            ensure(store).is_a(stores.SQLiteStateStore)
+            ensure(store.path).equals(os.path.join(tmp, 'states.sqlite'))
+            ensure(store.batch_size).equals(5)
+        finally:
+            shutil.rmtree(tmp)
@@ -5,6 +5,7 @@ import unittest
 
 from path import path
 from ensure import ensure
+from mock import patch
 
 
 class LoadPlotFromPathTests(unittest.TestCase):
@@ -13,3 +14,171 @@ class LoadPlotFromPathTests(unittest.TestCase):
         PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
         plot = storyfile.load_plot_from_path(PATH)
         ensure(plot.by_name).contains('start')
+
+    def test_it_should_load_the_same_plot_with_a_pool_of_workers(self):
+        from storyline import storyfile
+        PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+        plot = storyfile.compile_plot_from_path(PATH, workers=2)
+        ensure(plot).equals(storyfile.compile_plot_from_path(PATH))
+
+    def test_it_should_defer_template_syntax_errors_with_a_pool_of_workers(self):
+        import tempfile
+        from jinja2 import TemplateSyntaxError
+        from storyline import storyfile
+        tmp = path(tempfile.mkdtemp())
+        try:
+            story_path = tmp / 'cloak'
+            PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+            PATH.copytree(story_path)
+            items = story_path / 'items.md'
+            items.write_text(items.text() + u'\n{{ broken( }}\n')
+            serial = storyfile.compile_plot_from_path(story_path)
+            parallel = storyfile.compile_plot_from_path(story_path, workers=2)
+            ensure(parallel).equals(serial)
+            broken = [r for r in parallel.iter_renderables() if u'broken(' in r.content]
+            ensure(broken).is_nonempty()
+            ensure(lambda: broken[-1].template).raises(TemplateSyntaxError)
+        finally:
+            tmp.rmtree()
+
+    def test_it_should_send_worker_errors_back_as_text(self):
+        from storyline import storyfile
+        PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+        series, error = storyfile._compile_dumped_series((PATH, PATH / 'missing.md', False))
+        ensure(series).is_none()
+        ensure(error).contains('missing.md')
+
+    def test_it_should_load_the_same_plot_when_streaming(self):
+        from storyline import storyfile
+        PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+        plot = storyfile.compile_plot_from_path(PATH, stream=True)
+        ensure(plot).equals(storyfile.compile_plot_from_path(PATH))
+
+
+class LoadPlotFromBundleTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = path(tempfile.mkdtemp())
+        self.story_path = self.tmp / 'cloak'
+        PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+        PATH.copytree(self.story_path)
+        self.bundle_path = self.story_path / 'plot.bundle'
+
+    def tearDown(self):
+        self.tmp.rmtree()
+
+    def write_bundle(self):
+        from storyline import storyfile, bundles
+        sources = storyfile.get_source_stamps(self.story_path)
+        plot = storyfile.compile_plot_from_path(self.story_path)
+        bundles.write_bundle(plot, self.bundle_path, sources)
+        return plot
+
+    def test_it_should_load_a_fresh_bundle(self):
+        from storyline import storyfile, bundles
+        self.write_bundle()
+        with patch.object(bundles, 'read_bundle', wraps=bundles.read_bundle) as read_bundle:
+            plot = storyfile.load_plot_from_path(self.story_path)
+            ensure(read_bundle.call_count).equals(1)
+        ensure(plot.by_name).contains('start')
+
+    def test_it_should_ignore_a_stale_bundle(self):
+        import os
+        from storyline import storyfile, bundles
+        self.write_bundle()
+        source = self.story_path / 'start.md'
+        mtime = self.bundle_path.getmtime() + 10
+        os.utime(source, (mtime, mtime))
+        with patch.object(bundles, 'read_bundle') as read_bundle:
+            plot = storyfile.load_plot_from_path(self.story_path)
+            ensure(read_bundle.call_count).equals(0)
+        ensure(plot.by_name).contains('start')
+
+    def test_it_should_ignore_a_bundle_with_a_deleted_source(self):
+        from storyline import storyfile, bundles
+        self.write_bundle()
+        (self.story_path / 'actions.md').remove()
+        with patch.object(bundles, 'read_bundle') as read_bundle:
+            plot = storyfile.load_plot_from_path(self.story_path)
+            ensure(read_bundle.call_count).equals(0)
+        ensure(plot.by_name).does_not_contain('actions')
+
+    def test_it_should_ignore_a_bundle_with_a_source_replaced_by_an_older_one(self):
+        import os
+        from storyline import storyfile, bundles
+        self.write_bundle()
+        source = self.story_path / 'actions.md'
+        source.write_text(u'# = wait\n\nTime passes.\n')
+        mtime = self.bundle_path.getmtime() - 1000
+        os.utime(source, (mtime, mtime))
+        with patch.object(bundles, 'read_bundle') as read_bundle:
+            plot = storyfile.load_plot_from_path(self.story_path)
+            ensure(read_bundle.call_count).equals(0)
+        ensure(plot.by_name['actions'].by_name).has_length(1)
+
+    def test_it_should_fall_back_to_sources_for_a_bad_bundle(self):
+        from storyline import storyfile
+        self.bundle_path.write_bytes('garbage')
+        plot = storyfile.load_plot_from_path(self.story_path)
+        ensure(plot.by_name).contains('start')
+
+
+class ReloadSeriesFromFileTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from storyline import storyfile
+        self.tmp = path(tempfile.mkdtemp())
+        self.story_path = self.tmp / 'cloak'
+        PATH = path(__file__).abspath().dirname().parent / 'features' / 'steps' / 'data' / 'cloak'
+        PATH.copytree(self.story_path)
+        self.plot = storyfile.compile_plot_from_path(self.story_path)
+
+    def tearDown(self):
+        self.tmp.rmtree()
+
+    def test_it_should_rebuild_only_the_changed_series(self):
+        from storyline import storyfile
+        source = self.story_path / 'actions.md'
+        source.write_text(u'# = wait\n\nTime passes.\n')
+        plot = storyfile.reload_series_from_file(self.plot, self.story_path, source)
+        ensure(plot).is_not(self.plot)
+        ensure(plot.by_name['actions'].by_name).has_length(1)
+        ensure(plot.by_name['actions'].by_name['wait'].content).equals(u'\nTime passes.')
+        for name in ('items', 'rooms', 'start'):
+            ensure(plot.by_name[name]).is_(self.plot.by_name[name])
+
+    def test_it_should_keep_the_static_html_of_the_other_series(self):
+        from mock import patch
+        from storyline import storyfile
+        from storyline import presenters
+        self.plot.pin_static_html()
+        kept = set()
+        for name in ('items', 'rooms', 'start'):
+            for situation in self.plot.by_name[name].ordered:
+                kept.update(self.plot.iter_static_messages(
+                    [situation] + situation.directives.values()))
+        ensure(len(self.plot.static_html)).is_greater_than(len(kept))
+        source = self.story_path / 'actions.md'
+        source.write_text(u'# = wait\n\nTime passes.\n')
+        with patch.object(presenters, 'to_html') as to_html:
+            plot = storyfile.reload_series_from_file(self.plot, self.story_path, source)
+        ensure(to_html.called).is_false()
+        ensure(set(plot.static_html)).equals(kept)
+        ensure(plot.static_html).is_not(self.plot.static_html)
+
+    def test_it_should_add_a_new_series(self):
+        from storyline import storyfile
+        source = self.story_path / 'more' / 'garden.md'
+        source.dirname().makedirs()
+        source.write_text(u'# = gate\n\nA gate.\n')
+        plot = storyfile.reload_series_from_file(self.plot, self.story_path, source)
+        ensure(plot.by_name).contains('more/garden')
+        ensure(plot.by_name).has_length(5)
+
+    def test_it_should_drop_the_series_of_a_deleted_file(self):
+        from storyline import storyfile
+        source = self.story_path / 'actions.md'
+        source.remove()
+        plot = storyfile.reload_series_from_file(self.plot, self.story_path, source)
+        ensure(plot.by_name).does_not_contain('actions')
+        ensure(plot.by_name['items']).is_(self.plot.by_name['items'])
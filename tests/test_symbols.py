@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.symbols
+"""
+import unittest
+
+from ensure import ensure
+
+
+class FindFlagsTests(unittest.TestCase):
+    def test_it_should_find_literal_flags(self):
+        from storyline import symbols
+        ensure(symbols.find_flags(
+            u"{{ flags.add('lit') }}{% if 'dark' in flags %}{{ flags.discard(name) }}{% endif %}"
+            u"{% if 'cold' not in flags %}{{ this.set('hot', 1) }}{% endif %}"
+        )).equals(set(['lit', 'dark', 'cold']))
+
+
+class SymbolTableTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import symbols
+        self.table = symbols.SymbolTable(
+            [(u'foo', u'bar'), (u'foo', u'baz'), (u'bar', u'foo')],
+            [u'lit', u'dark'] + [u'flag {}'.format(i) for i in range(10)],
+        )
+
+    def test_it_should_number_situations_in_order(self):
+        ensure(self.table.pack_pair((u'bar', u'foo'))).equals(0)
+        ensure(self.table.pack_pair([u'foo', u'baz'])).equals(2)
+        ensure(self.table.unpack_pair(2)).equals((u'foo', u'baz'))
+        ensure(self.table.pack_pair(None)).is_none()
+
+    def test_it_should_pass_unknown_situations_through(self):
+        ensure(self.table.pack_pair((u'foo', u'qux'))).equals((u'foo', u'qux'))
+        ensure(self.table.unpack_pair([u'foo', u'qux'])).equals([u'foo', u'qux'])
+
+    def test_it_should_refuse_ids_and_bits_not_in_the_table(self):
+        ensure(self.table.unpack_pair).called_with(3).raises(IndexError)
+        ensure(self.table.unpack_pair).called_with(-1).raises(IndexError)
+        ensure(self.table.unpack_flags).called_with('\x00\x80').raises(IndexError)
+
+    def test_it_should_pack_flags_as_a_bitset(self):
+        bits, extra = self.table.pack_flags([u'lit', u'flag 9', u'unknown'])
+        ensure(bits).is_a(str)
+        ensure(len(bits)).is_less_than_or_equal_to(2)
+        ensure(extra).equals([u'unknown'])
+        ensure(self.table.unpack_flags(bits, extra)).equals(set([u'lit', u'flag 9', u'unknown']))
+        ensure(self.table.pack_flags([])).equals(('', []))
+
+    def test_it_should_identify_its_version(self):
+        from storyline import symbols
+        same = symbols.SymbolTable(reversed(self.table.pairs), self.table.flags)
+        other = symbols.SymbolTable(self.table.pairs, [u'lit'])
+        ensure(same.version).equals(self.table.version)
+        ensure(other.version).does_not_equal(self.table.version)
+
+    def test_it_should_be_built_from_a_plot(self):
+        from storyline import entities
+        situation = entities.Situation(
+            name='bar', series='foo', content="{{ flags.add('seen') }}",
+            directives={
+                'go': entities.Directive(name='go', situation='bar', content="{% if 'lit' in flags %}{% endif %}"),
+            },
+        )
+        plot = entities.Plot(
+            by_name={'foo': entities.Series(
+                name='foo', content='', ordered=[situation], by_name={'bar': situation})},
+            config={},
+        )
+        ensure(plot.symbols.pairs).equals(((u'foo', u'bar'), ))
+        ensure(plot.symbols.flags).equals((u'lit', u'seen'))
+        ensure(plot.symbols).is_(plot.symbols)
@@ -26,3 +26,188 @@ class RenderableTests(unittest.TestCase):
 
         obj = MyObject()
         ensure(obj.render).called_with({'what': 'baz'}).equals('foo bar baz')
+
+    def test_it_should_know_the_names_its_template_refers_to(self):
+        from storyline import templates
+
+        class MyObject(templates.Renderable):
+            content = "{% for x in things %}{{ x }}{{ loop.index }}{% endfor %}{{ push(what) }}"
+
+        ensure(MyObject().names).equals(frozenset(['things', 'push', 'what']))
+
+    def test_it_should_only_look_up_the_names_it_refers_to(self):
+        from storyline import templates
+        from mock import MagicMock
+
+        class MyObject(templates.Renderable):
+            content = "foo {{ what }} {{ args|join }}"
+
+        context = MagicMock()
+        context.__contains__.side_effect = lambda name: name in ('what', 'ignored')
+        context.__getitem__.return_value = 'bar'
+        ensure(MyObject().render(context, args=('baz', ))).equals('foo bar baz')
+        context.__getitem__.assert_called_once_with('what')
+
+    def test_it_should_know_whether_its_template_is_static(self):
+        from storyline import templates
+
+        class Static(templates.Renderable):
+            content = u"Hello, *bar*!\n!! Not shown.\n"
+
+        class Dynamic(templates.Renderable):
+            content = u"Hello, {{ who }}!"
+
+        ensure(Static().static_text).equals(u"Hello, *bar*!\n")
+        ensure(Dynamic().static_text).is_none()
+
+    def test_it_should_not_look_up_anything_to_render_a_static_template(self):
+        from storyline import templates
+        from mock import MagicMock
+
+        class MyObject(templates.Renderable):
+            content = u"Hello, bar!"
+
+        context = MagicMock()
+        ensure(MyObject().render(context)).equals(u"Hello, bar!")
+        ensure(context.mock_calls).is_empty()
+
+
+class BytecodeCacheTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        self.cache_dir = path(tempfile.mkdtemp()) / 'cache'
+
+    def tearDown(self):
+        from storyline import templates
+        templates.set_bytecode_cache(None)
+        self.cache_dir.dirname().rmtree()
+
+    def test_it_should_cache_bytecode_by_source(self):
+        from mock import patch
+        from storyline import templates
+        templates.set_bytecode_cache(self.cache_dir)
+        template = templates.get_template_from_string(u'foo {{ bar }}')
+        ensure(template.render(bar='baz')).equals('foo baz')
+        ensure(self.cache_dir.files()).has_length(1)
+
+        with patch.object(templates, 'compile_template_code') as compile_template_code:
+            template = templates.get_template_from_string(u'foo {{ bar }}')
+            ensure(compile_template_code.call_count).equals(0)
+        ensure(template.render(bar='baz')).equals('foo baz')
+
+    def test_it_should_turn_the_cache_off(self):
+        from storyline import templates
+        templates.set_bytecode_cache(self.cache_dir)
+        templates.set_bytecode_cache(None)
+        ensure(templates.bytecode_cache).is_none()
+
+
+class TemplateRegistryTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import templates
+        self.registry = templates.TemplateRegistry()
+
+    def test_it_should_share_one_template_per_source(self):
+        template = self.registry.get(u'{{ push("foo") }}')
+        ensure(self.registry.get(u'{{ push("foo") }}')).is_(template)
+        ensure(self.registry.get(u'{{ push("bar") }}')).is_not(template)
+        ensure(self.registry).has_length(2)
+        ensure(self.registry.hits).equals(1)
+        ensure(self.registry.misses).equals(2)
+
+    def test_it_should_share_one_set_of_names_per_source(self):
+        names = self.registry.get_names(u'{{ push(foo) }}')
+        ensure(names).equals(frozenset(['push', 'foo']))
+        ensure(self.registry.get_names(u'{{ push(foo) }}')).is_(names)
+
+    def test_it_should_only_find_static_text_for_plain_sources(self):
+        from storyline import templates
+        ensure(templates.is_static(u'Hello,\n\nbar!')).is_true()
+        ensure(templates.is_static(u'Hello {# a comment #}bar!')).is_true()
+        ensure(templates.is_static(u'Hello {{ "bar" }}!')).is_false()
+        ensure(templates.is_static(u'% if foo\nHello!\n% endif')).is_false()
+        ensure(self.registry.get_static_text(u'Hello {# a comment #}bar!')).equals(u'Hello bar!')
+        ensure(self.registry.get_static_text(u'Hello {{ "bar" }}!')).is_none()
+
+    def test_it_should_keep_the_first_template_added(self):
+        from storyline import templates
+        template = self.registry.get(u'foo')
+        other = templates.get_template_from_string(u'foo')
+        ensure(self.registry.add(templates.get_source_key(u'foo'), other)).is_(template)
+
+    def test_it_should_evict_the_least_recently_used_sources(self):
+        from storyline import templates
+        registry = templates.TemplateRegistry(maxsize=2)
+        foo = registry.get(u'foo {{ bar }}')
+        registry.get(u'baz {{ bar }}')
+        ensure(registry.get(u'foo {{ bar }}')).is_(foo)
+        registry.get(u'qux {{ bar }}')
+        ensure(registry).has_length(2)
+        ensure(registry).contains(templates.get_source_key(u'foo {{ bar }}'))
+        ensure(registry).does_not_contain(templates.get_source_key(u'baz {{ bar }}'))
+        ensure(registry.hits).equals(1)
+        ensure(registry.misses).equals(3)
+
+    def test_it_should_bound_names_and_static_text_too(self):
+        from storyline import templates
+        registry = templates.TemplateRegistry(maxsize=2)
+        for source in (u'foo', u'bar', u'{{ baz }}', u'{{ qux }}'):
+            registry.get_names(source)
+            registry.get_static_text(source)
+        ensure(registry.names).has_length(2)
+        ensure(registry.static).has_length(2)
+        ensure(registry.get_static_text(u'foo')).equals(u'foo')
+        ensure(registry.get_static_text(u'{{ baz }}')).is_none()
+
+    def test_it_should_resize_from_the_next_source_added(self):
+        from storyline import templates
+        registry = templates.TemplateRegistry(maxsize=4)
+        for source in (u'foo', u'bar', u'baz'):
+            registry.get(source)
+        registry.resize(1)
+        registry.get(u'qux')
+        ensure(registry.maxsize).equals(1)
+        ensure(registry).has_length(1)
+
+    def test_renderables_should_use_the_shared_registry(self):
+        from storyline import templates
+
+        class MyObject(templates.Renderable):
+            content = "shared {{ what }}"
+
+        ensure(MyObject().template).is_(MyObject().template)
+
+
+class TemplateModulesTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        self.tmp = path(tempfile.mkdtemp())
+        self.target = self.tmp / 'templates.zip'
+
+    def tearDown(self):
+        from storyline import templates
+        templates.set_template_modules(None)
+        self.tmp.rmtree()
+
+    def test_it_should_import_precompiled_templates(self):
+        from mock import patch
+        from storyline import templates
+        templates.compile_template_modules([u'foo {{ bar }}', u'{{ push("baz") }}'], self.target)
+        templates.set_template_modules(self.target)
+
+        registry = templates.TemplateRegistry()
+        with patch.object(templates, 'get_template_from_string') as get_template_from_string:
+            template = registry.get(u'foo {{ bar }}')
+            ensure(get_template_from_string.call_count).equals(0)
+        ensure(template.render(bar='baz')).equals('foo baz')
+
+    def test_it_should_compile_templates_missing_from_the_modules(self):
+        from storyline import templates
+        templates.compile_template_modules([u'foo {{ bar }}'], self.target)
+        templates.set_template_modules(self.target)
+
+        ensure(templates.get_template_from_module(templates.get_source_key(u'nope'))).is_none()
+        registry = templates.TemplateRegistry()
+        ensure(registry.get(u'nope {{ bar }}').render(bar='baz')).equals('nope baz')
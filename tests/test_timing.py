@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""tests for storyline.timing
+"""
+import unittest
+
+from mock import patch
+from ensure import ensure
+
+
+class HistogramTests(unittest.TestCase):
+    def test_it_should_count_durations_in_cumulative_buckets(self):
+        from storyline import timing
+        histogram = timing.Histogram([0.001, 0.01])
+        for duration in (0.0005, 0.001, 0.005, 2.0):
+            histogram.observe(duration)
+        ensure(histogram.cumulative_counts()).equals([(0.001, 2), (0.01, 3), (float('inf'), 4)])
+        ensure(histogram.count).equals(4)
+        ensure(histogram.sum).equals(2.0065)
+
+
+class MetricsTests(unittest.TestCase):
+    def test_it_should_expose_histograms_in_prometheus_text_format(self):
+        from storyline import timing
+        metrics = timing.Metrics([0.001])
+        metrics.observe('trigger', 0.0005)
+        metrics.observe('trigger', 0.5)
+        ensure(metrics.exposition()).equals(
+            '# HELP storyline_stage_seconds Time spent in each stage of a turn.\n'
+            '# TYPE storyline_stage_seconds histogram\n'
+            'storyline_stage_seconds_bucket{stage="trigger",le="0.001"} 1\n'
+            'storyline_stage_seconds_bucket{stage="trigger",le="+Inf"} 2\n'
+            'storyline_stage_seconds_sum{stage="trigger"} 0.5005\n'
+            'storyline_stage_seconds_count{stage="trigger"} 2\n'
+        )
+
+
+class TimingTests(unittest.TestCase):
+    def setUp(self):
+        from storyline import timing
+        self.metrics = timing.Metrics()
+        self.patcher = patch.object(timing, 'metrics', self.metrics)
+        self.patcher.start()
+
+    def tearDown(self):
+        from storyline import timing
+        timing.disable()
+        timing.local.timings = None
+        self.patcher.stop()
+
+    def test_it_should_restore_every_stage_when_disabled(self):
+        from storyline import timing
+        from storyline import states
+        from storyline import serializers
+        trigger = states.Transition.__dict__['trigger']
+        loads = serializers.MsgPackStateSerializer.__dict__['loads']
+        timing.enable()
+        ensure(states.Transition.__dict__['trigger']).is_not(trigger)
+        timing.disable()
+        ensure(states.Transition.__dict__['trigger']).is_(trigger)
+        ensure(serializers.MsgPackStateSerializer.__dict__['loads']).is_(loads)
+
+    def test_it_should_time_each_stage_of_a_request(self):
+        from storyline import timing
+        from storyline import presenters
+        timing.enable()
+        timing.start_request()
+        presenters.to_html(u'Hello, *bar*!')
+        timings = timing.finish_request()
+        ensure(timings.keys()).equals(['markdown', 'typogrify', 'request'])
+        ensure(self.metrics.histograms['markdown'].count).equals(1)
+        ensure(self.metrics.histograms['request'].count).equals(1)
+
+    def test_it_should_time_a_stage_called_from_itself_once(self):
+        from storyline import timing
+        calls = []
+
+        def stage(depth):
+            calls.append(depth)
+            if depth:
+                wrapped(depth - 1)
+        wrapped = timing.timed('stage', stage)
+        wrapped(2)
+        ensure(calls).equals([2, 1, 0])
+        ensure(self.metrics.histograms['stage'].count).equals(1)
+
+    def test_it_should_only_observe_stages_outside_a_request(self):
+        from storyline import timing
+        timing.observe('trigger', 0.5)
+        ensure(timing.finish_request()).is_empty()
+        ensure(self.metrics.histograms['trigger'].count).equals(1)
+
+    def test_it_should_format_a_server_timing_header(self):
+        from collections import OrderedDict
+        from storyline import timing
+        timings = OrderedDict([('trigger', 0.0012345), ('request', 0.01)])
+        ensure(timing.server_timing(timings)).equals('trigger;dur=1.234, request;dur=10.000')
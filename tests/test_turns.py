@@ -77,6 +77,16 @@ class TurnManagerTests(unittest.TestCase):
         ensure(sorted(self.turn_mgr.state.keys())).equals(sorted(self.state_dict.keys()))
         ensure(self.turn_mgr.state.stack).equals([('foo', 'bar')])
 
+    def test_it_should_accept_a_plotstate_without_validating_it_again(self):
+        from mock import patch
+        from storyline import states
+        from storyline import turns
+        state = self.turn_mgr.state.add_message(u'Hello')
+        with patch.object(states.PlotState, '__init__') as init:
+            turn_mgr = turns.TurnManager(self.plot, state)
+        ensure(init.called).is_false()
+        ensure(turn_mgr.state).equals(state.clear_messages())
+
     def test_it_should_create_fresh_plotstate_when_no_state_dict_is_provided(self):
         from storyline import states
         from storyline import turns
@@ -122,3 +132,12 @@ class TurnManagerTests(unittest.TestCase):
         ensure(story).equals('<p>Hello,&nbsp;bar!</p>')
         ensure(state).is_(self.turn_mgr.state)
         ensure(self.turn_mgr.state.messages).is_empty()
+
+    def test_it_should_take_a_turn_and_stream_the_story(self):
+        from storyline import turns
+        turn_mgr = turns.TurnManager(self.plot, self.state_dict, stream=True)
+        story, state = turn_mgr.take_turn('Onward!')
+        ensure(state.messages).is_empty()
+        ensure(state.stack).equals([('foo', 'bar'), ('foo', 'baz')])
+        ensure(list(story)).equals(
+            ['<p>Exit&nbsp;bar!</p>', '\n<p>Enter&nbsp;baz!</p>', '\n<p>Hello,&nbsp;baz!</p>'])